@@ -2,52 +2,127 @@ import socket
 import json
 import threading
 import ssl
+import time
+
+from protocol import FrameDecoder, decode_result, encode_json, encode_move_message, is_json
+
+RECV_SIZE = 4096
+CONNECT_TIMEOUT = 10
+RESUME_TIMEOUT = 55 # Seconds to keep trying to get our seat back; the server holds it for 60
+RESUME_DELAYS = (0.2, 0.5, 1, 2, 5) # Wait before each reconnect attempt; the last one repeats
+HEARTBEAT_INTERVAL = 15 # Seconds of silence from the server before we PING it
+SERVER_TIMEOUT = 45 # Seconds of silence, PINGs unanswered, before the connection counts as dead
 
 class ChessClient:
-    def __init__(self, host, port, name, room, on_receive_callback=None):
+    def __init__(self, host, port, name, room, on_receive_callback=None, engine=None, protocol="json",
+                 spectate=False):
         self.host = host
         self.port = port
         self.name = name
         self.room = room
+        self.engine = engine # Rules engine to request if this client creates the room
         self.sock = None
+        self.send_lock = threading.Lock() # The UI and listener threads both send: one frame at a time
+        self.context = None # Kept across reconnects so TLS sessions can be resumed
+        self.session = None
         self.listener_thread = None
         self.on_receive_callback = on_receive_callback
+        self.protocol = protocol # "json", or "binary" for compact move messages
+        self.spectate = spectate # Watch the room's game instead of taking a seat
+        self.binary_active = False # Set once the server accepts binary mode
+        self.names = {} # { role: name }, needed to decode binary results
+        self.verbose = True # Print every received message
+        self.token = None # From the JOIN reply; lets a dropped connection RESUME its seat
+        self.ply = 0 # Moves seen so far, so a RESUME only asks for the ones after it
 
 
         # Send JOIN message
 
     def connect(self):
         try:
+            self.token = None
+            self.open_socket()
+            self.send_json(self.join_message())
+            self.start_listener()
+            return True
+        except Exception as e:
+            print(f"[ERROR] Connection failed: {e}")
+            return False
 
-            raw_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    def open_socket(self):
+        raw_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
 
-            context = ssl.create_default_context()
-            context.check_hostname = False
-            context.verify_mode = ssl.CERT_NONE  
+        if self.context is None:
+            self.context = ssl.create_default_context()
+            self.context.check_hostname = False
+            self.context.verify_mode = ssl.CERT_NONE  
 
-            self.sock = context.wrap_socket(raw_sock)
-            self.sock.connect((self.host, self.port))
+        # Offering the last session lets the server skip a full handshake
+        self.sock = self.context.wrap_socket(raw_sock, session=self.session)
+        self.sock.settimeout(CONNECT_TIMEOUT)
+        self.sock.connect((self.host, self.port))
+        self.sock.settimeout(HEARTBEAT_INTERVAL) # So listen() wakes up to PING a quiet server
+        if self.sock.session_reused and self.verbose:
+            print("[TLS] Resumed previous session")
 
-            # self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            # self.sock.connect((self.host, self.port))
+        # self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        # self.sock.connect((self.host, self.port))
 
-            join_msg = {
-                "type": "JOIN",
-                "name": self.name,
-                "room": self.room
-            }
-            self.send_json(join_msg)
+    def start_listener(self):
+        self.listener_thread = threading.Thread(target=self.listen, args=(self.sock,), daemon=True)
+        self.listener_thread.start()
 
-            # Start listener thread
-            self.listener_thread = threading.Thread(target=self.listen, daemon=True)
-            self.listener_thread.start()
-            return True
-        except Exception as e:
-            print(f"[ERROR] Connection failed: {e}")
-            return False
+    def join_message(self):
+        join_msg = {
+            "type": "SPECTATE" if self.spectate else "JOIN",
+            "name": self.name,
+            "room": self.room
+        }
+        if self.engine:
+            join_msg["engine"] = self.engine
+        if self.protocol != "json":
+            join_msg["protocol"] = self.protocol
+        return join_msg
+
+    def resume(self, dropped_sock):
+        """
+        Called when the connection drops mid-game: reconnects and sends RESUME
+        with our token, so the server gives back the seat and only the moves we missed.
+        """
+        try:
+            self.session = dropped_sock.session or self.session
+        except Exception:
+            pass
+        dropped_sock.close()
+        deadline = time.monotonic() + RESUME_TIMEOUT
+        attempt = 0
+        while self.token and time.monotonic() < deadline:
+            time.sleep(RESUME_DELAYS[min(attempt, len(RESUME_DELAYS) - 1)])
+            attempt += 1
+            if self.sock is not dropped_sock:
+                return # close() or connect() was called meanwhile
+            try:
+                self.open_socket()
+            except Exception as e:
+                self.sock = dropped_sock
+                if self.verbose:
+                    print(f"[RESUME] Reconnect failed: {e}")
+                continue
+            resume_msg = {"type": "RESUME", "room": self.room, "token": self.token, "ply": self.ply}
+            if self.protocol != "json":
+                resume_msg["protocol"] = self.protocol
+            self.send_json(resume_msg)
+            self.start_listener()
+            return
+        if self.sock is dropped_sock and self.on_receive_callback:
+            self.on_receive_callback({"status": "fail", "message": "Connection to the server lost."})
 
     def send_move(self, from_pos, to_pos, promotion_to=None):
         """ Sends a move, now with an optional promotion choice. """
+        if self.binary_active:
+            self.send_bytes(encode_move_message(from_pos, to_pos, promotion_to))
+            return
+
         move_msg = {
             "type": "MOVE",
             "selected_pos": from_pos,
@@ -59,26 +134,92 @@ class ChessClient:
         self.send_json(move_msg)
 
     def send_json(self, data):
+        self.send_bytes(encode_json(data))
+
+    def send_bytes(self, data):
+        # Two threads in sendall on one SSL socket can interleave or corrupt frames
         try:
-            self.sock.sendall(json.dumps(data).encode("utf-8"))
+            with self.send_lock:
+                self.sock.sendall(data)
         except Exception as e:
             print(f"[ERROR] Send failed: {e}")
 
-    def listen(self):
+    def listen(self, sock):
+        decoder = FrameDecoder()
+        last_heard = time.monotonic()
         while True:
             try:
-                data = self.sock.recv(1024)
+                try:
+                    data = sock.recv(RECV_SIZE)
+                except socket.timeout:
+                    if time.monotonic() - last_heard > SERVER_TIMEOUT:
+                        print("[ERROR] Server stopped answering")
+                        break
+                    if sock is self.sock:
+                        self.send_json({"type": "PING"})
+                    continue
+                last_heard = time.monotonic()
                 if data:
-                    message = json.loads(data.decode("utf-8"))
-                    print(f"[RECEIVED] {message}")
-                    if self.on_receive_callback:
-                        self.on_receive_callback(message)
+                    # A reply and an UPDATE can arrive in one recv
+                    for payload in decoder.feed(data):
+                        message = self.decode(payload)
+                        if message.get("type") in ("PING", "PONG"):
+                            continue # Heartbeats are answered in decode(), the UI never sees them
+                        if self.verbose:
+                            print(f"[RECEIVED] {message}")
+                        if self.on_receive_callback:
+                            self.on_receive_callback(message)
                 else:
                     break
             except Exception as e:
-                print(f"[ERROR] Listen failed: {e}")
+                if sock is self.sock: # Not an error if we have already closed or replaced it
+                    print(f"[ERROR] Listen failed: {e}")
                 break
+        if sock is self.sock and self.token:
+            self.resume(sock) # Dropped, not closed by us
+
+    def decode(self, payload):
+        if not is_json(payload):
+            message = decode_result(payload, self.names)
+            if message["status"] == "success":
+                self.ply += 1
+            return message
+
+        message = json.loads(payload)
+        if message.get("type") == "PING":
+            self.send_json({"type": "PONG"})
+            return message
+        if "names" in message:
+            self.names = message["names"]
+        if message.get("status") in ("joined", "resumed"):
+            self.binary_active = message.get("protocol") == "binary"
+            self.token = message.get("token", self.token)
+        if "ply" in message:
+            self.ply = message["ply"] # JOIN, RESUME and SNAPSHOT replies say where the game is
+        elif message.get("status") == "success" and "from" in message:
+            self.ply += 1
+        if message.get("resume") == "failed":
+            # The seat is gone (or the server restarted): take a new one
+            self.token = None
+            self.send_json(self.join_message())
+        return message
+
+    def reconnect(self):
+        """Drops the current connection and joins again, resuming the TLS session when possible."""
+        self.close()
+        return self.connect()
 
     def close(self):
+        seated, self.token = self.token, None # No RESUME after a deliberate close
+        if self.sock and seated:
+            self.send_json({"type": "LEAVE"}) # Frees our seat now instead of after the grace period
         if self.sock:
-            self.sock.close()
\ No newline at end of file
+            # TLS 1.3 tickets arrive after the handshake, so pick the session up as late as possible
+            try:
+                self.session = self.sock.session or self.session
+                # Wakes the listener thread with a clean EOF instead of a read on a closed socket
+                self.sock.shutdown(socket.SHUT_RDWR)
+            except Exception:
+                pass
+            self.sock.close()
+            self.sock = None
\ No newline at end of file
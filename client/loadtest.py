@@ -0,0 +1,211 @@
+## Headless load generator
+##
+## Starts --rooms rooms with two bots each. Every bot is a ChessClient that plays
+## random legal moves (from the list the server sends with each position) and times each
+## move from send_move to the server's reply. When a game ends, or reaches
+## --max-plies, both bots move on to a fresh room. Prints throughput every
+## --report seconds and p50/p95/p99 move round-trip times at the end.
+##
+##   python server/main.py --mode async          # in one terminal
+##   python client/loadtest.py --rooms 50 --duration 30 --protocol binary
+
+import argparse
+import os
+import random
+import threading
+import time
+
+from client_logic import ChessClient
+
+
+class Stats:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.rtts = []  # Seconds, one per answered move
+        self.failed = 0  # Moves the server rejected
+        self.games = 0
+
+    def record(self, rtt, success):
+        with self.lock:
+            self.rtts.append(rtt)
+            if not success:
+                self.failed += 1
+
+    def game_over(self):
+        with self.lock:
+            self.games += 1
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+
+class Bot:
+
+    def __init__(self, args, stats, room_id, seat):
+        self.args = args
+        self.stats = stats
+        self.room_id = room_id
+        self.generation = 0
+        self.legal = ""  # Packed legal moves of the side to move, from the server
+        self.role = None
+        self.plies = 0
+        self.opponent_joined = False
+        self.sent_at = None
+        self.stopped = False
+        self.random = random.Random(args.seed * 100003 + room_id * 2 + seat if args.seed else None)
+        self.client = ChessClient(args.host, args.port, f"bot{room_id}-{seat}", self.room_name(),
+                                  self.on_message, engine=args.engine, protocol=args.protocol)
+        self.client.verbose = False
+
+    def room_name(self):
+        return f"{self.args.prefix}{self.room_id}-{self.generation}"
+
+    def start(self):
+        return self.client.connect()
+
+    def stop(self):
+        self.stopped = True
+        self.client.close()
+
+    def on_message(self, message):
+        if self.stopped:
+            return
+        if "legal" in message:
+            self.legal = message["legal"]
+        if message.get("status") == "joined":
+            self.role = message["role"]
+            self.plies = message["ply"]
+            self.opponent_joined = len(message.get("names", {})) == 2
+            self.maybe_move()
+        elif message.get("status") == "resumed":
+            # Our connection dropped and came back: the server says where the game is
+            self.plies = message["ply"]
+            self.sent_at = None
+            self.opponent_joined = len(message["names"]) == 2
+            if message.get("game_over") or self.plies >= self.args.max_plies:
+                self.next_game()
+            else:
+                self.maybe_move()
+        elif message.get("type") == "NAMES":
+            self.opponent_joined = len(message["names"]) == 2
+            self.maybe_move()
+        elif message.get("type") == "SNAPSHOT":
+            # We were too slow and the server skipped us ahead; a pending reply may be lost
+            self.plies = message["ply"]
+            self.sent_at = None
+            self.opponent_joined = len(message["names"]) == 2
+            if message.get("game_over") or self.plies >= self.args.max_plies:
+                self.next_game()
+            else:
+                self.maybe_move()
+        elif message.get("type") == "UPDATE":
+            self.apply(message)
+        elif self.sent_at is not None:
+            # The reply to our own move
+            self.stats.record(time.perf_counter() - self.sent_at, message.get("status") == "success")
+            self.sent_at = None
+            if "from" in message:
+                self.apply(message)
+
+    def apply(self, message):
+        if message.get("status") == "success":
+            self.plies += 1
+        if message.get("game_over") or self.plies >= self.args.max_plies:
+            if self.role == "white":
+                self.stats.game_over()  # Counted once per room
+            self.next_game()
+        else:
+            self.maybe_move()
+
+    def maybe_move(self):
+        if not self.opponent_joined or self.sent_at is not None:
+            return
+        turn = "white" if self.plies % 2 == 0 else "black"
+        if turn != self.role:
+            return
+        if not self.legal:
+            return  # The server will have reported the game over
+        if self.args.move_delay:
+            time.sleep(self.args.move_delay)
+            if self.stopped:
+                return
+        i = self.random.randrange(len(self.legal) // 4) * 4
+        src, dst = self.legal[i:i + 2], self.legal[i + 2:i + 4]
+        self.sent_at = time.perf_counter()
+        self.client.send_move(src, dst)
+
+    def next_game(self):
+        self.generation += 1
+        self.client.room = self.room_name()
+        self.legal = ""
+        self.sent_at = None
+        self.opponent_joined = False
+        self.client.reconnect()
+
+
+def report(stats, elapsed, final=False):
+    with stats.lock:
+        rtts = sorted(stats.rtts)
+        failed = stats.failed
+        games = stats.games
+    moves = len(rtts)
+    print(f"[{elapsed:6.1f}s] {moves} moves ({moves / max(elapsed, 1e-9):,.0f}/s), "
+          f"{games} games, {failed} rejected")
+    if final:
+        print(f"move round trip: p50 {percentile(rtts, 0.50) * 1000:.2f} ms  "
+              f"p95 {percentile(rtts, 0.95) * 1000:.2f} ms  "
+              f"p99 {percentile(rtts, 0.99) * 1000:.2f} ms  "
+              f"max {(rtts[-1] if rtts else 0) * 1000:.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bot swarm load test for the chess server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=60000)
+    parser.add_argument("--rooms", type=int, default=10, help="concurrent rooms (two bots each)")
+    parser.add_argument("--duration", type=float, default=30, help="seconds to run")
+    parser.add_argument("--move-delay", type=float, default=0,
+                        help="seconds a bot waits before each move (0: as fast as possible)")
+    parser.add_argument("--max-plies", type=int, default=200,
+                        help="moves after which an undecided game is abandoned for a new room")
+    parser.add_argument("--protocol", choices=["json", "binary"], default="json")
+    parser.add_argument("--engine", choices=["list", "bitboard"], default=None)
+    parser.add_argument("--prefix", default=f"load{os.getpid()}-", help="room name prefix")
+    parser.add_argument("--seed", type=int, default=0, help="random seed (0: unseeded)")
+    parser.add_argument("--report", type=float, default=5, help="seconds between progress reports")
+    args = parser.parse_args()
+
+    stats = Stats()
+    bots = []
+    for room_id in range(args.rooms):
+        for seat in range(2):
+            bot = Bot(args, stats, room_id, seat)
+            if not bot.start():
+                print(f"[ERROR] bot{room_id}-{seat} could not connect")
+            bots.append(bot)
+
+    start = time.perf_counter()
+    try:
+        while True:
+            elapsed = time.perf_counter() - start
+            if elapsed >= args.duration:
+                break
+            time.sleep(min(args.report, args.duration - elapsed))
+            if time.perf_counter() - start < args.duration:
+                report(stats, time.perf_counter() - start)
+    except KeyboardInterrupt:
+        pass
+
+    elapsed = time.perf_counter() - start
+    for bot in bots:
+        bot.stop()
+    report(stats, elapsed, final=True)
+
+
+if __name__ == "__main__":
+    main()
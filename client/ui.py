@@ -2,10 +2,12 @@ import tkinter as tk
 from tkinter import messagebox, simpledialog, font
 # Make sure client_logic.py is in the same folder
 from client_logic import ChessClient 
+from protocol import parse_legal_moves
 
 # --- Configuration ---
 HOST = '127.0.0.1' 
 PORT = 60000
+PROTOCOL = "json" # "binary" sends moves and results as a few bytes instead of JSON
 BOARD_SIZE = 8
 SQUARE_SIZE = 60
 BOARD_DIM = BOARD_SIZE * SQUARE_SIZE
@@ -85,9 +87,11 @@ class ChessUI(tk.Tk):
         self.client = None
         self.my_name = "" # <-- NEW: To store your own name
         self.player_role = None  # 'white' or 'black'
+        self.spectating = False # Watching a room instead of playing
         self.current_turn = 'white'
         self.selected_square = None
         self.legal_moves = [] # Holds list of (r, c) tuples for legal moves
+        self.move_targets = {} # { (r, c): [(r, c), ...] } every legal move of the side to move, sent by the server
         self.board_state = [
             ["r", "n", "b", "q", "k", "b", "n", "r"],
             ["p", "p", "p", "p", "p", "p", "p", "p"],
@@ -118,6 +122,9 @@ class ChessUI(tk.Tk):
         self.room_entry = tk.Entry(self.connection_frame, width=20)
         self.room_entry.pack(pady=5)
 
+        self.watch_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(self.connection_frame, text="Watch only", variable=self.watch_var).pack()
+
         self.connect_button = tk.Button(self.connection_frame, text="Connect", command=self.connect_to_server)
         self.connect_button.pack(pady=15)
 
@@ -134,6 +141,7 @@ class ChessUI(tk.Tk):
         self.canvas.pack(pady=10)
         self.canvas.bind("<Button-1>", self.on_board_click)
         
+        self.create_board_items()
         self.draw_board()
 
     def connect_to_server(self):
@@ -148,9 +156,14 @@ class ChessUI(tk.Tk):
         try:
             # Pass the UI-thread-safe callback to the client
             self.my_name = name # <-- NEW: Store your name
-            self.client = ChessClient(ip, PORT, name, room, on_receive_callback=self.handle_server_message)
+            self.spectating = self.watch_var.get()
+            self.client = ChessClient(ip, PORT, name, room, on_receive_callback=self.handle_server_message,
+                                      protocol=PROTOCOL, spectate=self.spectating)
             if self.client.connect():
-                messagebox.showinfo("Connected", f"Connected as {name} in room {room}")
+                if self.spectating:
+                    messagebox.showinfo("Connected", f"Watching room {room}")
+                else:
+                    messagebox.showinfo("Connected", f"Connected as {name} in room {room}")
                 self.connection_frame.pack_forget()
                 self.game_frame.pack(fill="both", expand=True)
             else:
@@ -160,18 +173,64 @@ class ChessUI(tk.Tk):
             messagebox.showerror("Error", f"An error occurred: {e}")
             self.client = None
 
+    def create_board_items(self):
+        """
+        Creates every canvas item once: a rectangle, a move marker and a piece per
+        square, plus the notation labels. draw_board only reconfigures them.
+        """
+        self.square_items = {} # { (display row, display col): (rectangle, marker, piece) }
+        for dr in range(BOARD_SIZE):
+            for dc in range(BOARD_SIZE):
+                x1 = dc * SQUARE_SIZE
+                y1 = dr * SQUARE_SIZE
+                rect = self.canvas.create_rectangle(x1, y1, x1 + SQUARE_SIZE, y1 + SQUARE_SIZE, outline="")
+                marker = self.canvas.create_oval(0, 0, 0, 0, state="hidden")
+                # Center the piece in the square
+                piece = self.canvas.create_text(
+                    x1 + SQUARE_SIZE // 2,
+                    y1 + SQUARE_SIZE // 2,
+                    text="",
+                    font=self.piece_font,
+                    # --- FIX: Draw all pieces with black fill ---
+                    fill="black"
+                    # --- END FIX ---
+                )
+                self.square_items[(dr, dc)] = (rect, marker, piece)
+
+        # Add algebraic notation, on top of the squares
+        self.file_labels = []
+        self.rank_labels = []
+        for i in range(BOARD_SIZE):
+            # Files (a-h)
+            self.file_labels.append(self.canvas.create_text(
+                i * SQUARE_SIZE + SQUARE_SIZE // 2,
+                BOARD_DIM - 10,
+                font=("Arial", 10, "bold"),
+                fill="#555555"
+            ))
+            # Ranks (1-8)
+            self.rank_labels.append(self.canvas.create_text(
+                10,
+                i * SQUARE_SIZE + SQUARE_SIZE // 2,
+                font=("Arial", 10, "bold"),
+                fill="#555555"
+            ))
+
+        self.drawn = {} # { (display row, display col): (color, marker, piece) } as last drawn
+        self.drawn_role = object() # Board orientation the squares were last drawn for; matches no role at first
+
     def draw_board(self):
-        self.canvas.delete("all")
+        """Updates only the squares whose color, legal move marker or piece changed since the last call."""
+        if self.drawn_role != self.player_role:
+            # The board flipped: every square shows a different one now
+            self.drawn_role = self.player_role
+            self.drawn = {}
+            self.draw_notation()
+
+        legal_moves = set(self.legal_moves)
         for r in range(BOARD_SIZE):
             for c in range(BOARD_SIZE):
-                # x1, y1 = c * SQUARE_SIZE, r * SQUARE_SIZE
-                # x2, y2 = x1 + SQUARE_SIZE, y1 + SQUARE_SIZE
-                dr, dc = self.display_coords(r, c)
-
-                x1 = dc * SQUARE_SIZE
-                y1 = dr * SQUARE_SIZE
-                x2 = x1 + SQUARE_SIZE
-                y2 = y1 + SQUARE_SIZE
+                piece_char = self.board_state[r][c]
 
                 # Determine square color
                 color = LIGHT_COLOR if (r + c) % 2 == 0 else DARK_COLOR
@@ -180,61 +239,56 @@ class ChessUI(tk.Tk):
                 if self.selected_square == (r, c):
                     color = SELECT_COLOR
 
-                self.canvas.create_rectangle(x1, y1, x2, y2, fill=color, outline="")
+                # Legal move indicator: a dot for empty squares, a ring for captures
+                marker = None
+                if (r, c) in legal_moves:
+                    marker = "dot" if piece_char == "." else "ring"
 
-                # Draw legal move indicators
-                if (r, c) in self.legal_moves:
-                    x_center = x1 + SQUARE_SIZE // 2
-                    y_center = y1 + SQUARE_SIZE // 2
-                    
-                    if self.board_state[r][c] == ".":
-                        # Draw a dot for empty squares
-                        radius = SQUARE_SIZE // 6
-                        self.canvas.create_oval(x_center - radius, y_center - radius,
-                                                x_center + radius, y_center + radius,
-                                                fill=LEGAL_MOVE_EMPTY_COLOR, outline="")
-                    else:
-                        # Draw a ring for captures
-                        radius = SQUARE_SIZE // 2 - 3
-                        self.canvas.create_oval(x_center - radius, y_center - radius,
-                                                x_center + radius, y_center + radius,
-                                                outline=LEGAL_MOVE_CAPTURE_COLOR, width=6)
+                square = self.display_coords(r, c)
+                if self.drawn.get(square) == (color, marker, piece_char):
+                    continue
+                self.drawn[square] = (color, marker, piece_char)
+                self.draw_square(square, color, marker, piece_char)
 
-                # Draw piece
-                piece_char = self.board_state[r][c]
-                if piece_char != ".":
-                    piece_unicode = PIECE_UNICODE.get(piece_char, "?")
-                    # Center the piece in the square
-                    self.canvas.create_text(
-                        x1 + SQUARE_SIZE // 2, 
-                        y1 + SQUARE_SIZE // 2, 
-                        text=piece_unicode, 
-                        font=self.piece_font, 
-                        # --- FIX: Draw all pieces with black fill ---
-                        fill="black"
-                        # --- END FIX ---
-                    )
-        
-        # Add algebraic notation
+    def draw_square(self, square, color, marker, piece_char):
+        rect, marker_item, piece = self.square_items[square]
+        dr, dc = square
+        self.canvas.itemconfigure(rect, fill=color)
+
+        if marker is None:
+            self.canvas.itemconfigure(marker_item, state="hidden")
+        else:
+            x_center = dc * SQUARE_SIZE + SQUARE_SIZE // 2
+            y_center = dr * SQUARE_SIZE + SQUARE_SIZE // 2
+            if marker == "dot":
+                radius = SQUARE_SIZE // 6
+                self.canvas.itemconfigure(marker_item, state="normal", fill=LEGAL_MOVE_EMPTY_COLOR,
+                                          outline="", width=1)
+            else:
+                radius = SQUARE_SIZE // 2 - 3
+                self.canvas.itemconfigure(marker_item, state="normal", fill="",
+                                          outline=LEGAL_MOVE_CAPTURE_COLOR, width=6)
+            self.canvas.coords(marker_item, x_center - radius, y_center - radius,
+                               x_center + radius, y_center + radius)
+
+        self.canvas.itemconfigure(piece, text=PIECE_UNICODE.get(piece_char, "?") if piece_char != "." else "")
+
+    def draw_notation(self):
         for i in range(BOARD_SIZE):
-            # Files (a-h)
-            self.canvas.create_text(
-                i * SQUARE_SIZE + SQUARE_SIZE // 2,
-                BOARD_DIM - 10,
-                text=chr(ord('a') + (7 - i)) if self.player_role == "black" else chr(ord('a') + i),
-                font=("Arial", 10, "bold"),
-                fill="#555555"
+            self.canvas.itemconfigure(
+                self.file_labels[i],
+                text=chr(ord('a') + (7 - i)) if self.player_role == "black" else chr(ord('a') + i)
             )
-            # Ranks (1-8)
-            self.canvas.create_text(
-                10,
-                i * SQUARE_SIZE + SQUARE_SIZE // 2,
-                text=str((i + 1) if self.player_role == "black" else (BOARD_SIZE - i)),
-                font=("Arial", 10, "bold"),
-                fill="#555555"
+            self.canvas.itemconfigure(
+                self.rank_labels[i],
+                text=str((i + 1) if self.player_role == "black" else (BOARD_SIZE - i))
             )
 
     def on_board_click(self, event):
+        if self.spectating:
+            self.update_status_label("You are watching this game.", "blue")
+            return
+
         if not self.client or not self.player_role:
             messagebox.showwarning("Wait", "Game has not started yet.")
             return
@@ -288,6 +342,20 @@ class ChessUI(tk.Tk):
                 self.draw_board()
                 return
 
+            if (dst_r, dst_c) not in self.get_legal_moves(src_r, src_c):
+                # The server would only reject it: don't send it
+                self.selected_square = None
+                piece = self.board_state[r][c]
+                if piece != "." and piece.isupper() == (self.player_role == "white"):
+                    # Clicked another of our pieces: select that one instead
+                    self.selected_square = (r, c)
+                    self.legal_moves = self.get_legal_moves(r, c)
+                    self.update_status_label(f"Selected {clicked_square_alg}")
+                else:
+                    self.update_status_label(f"{src_alg} to {dst_alg} is not a legal move.", "red")
+                self.draw_board()
+                return
+
             # --- NEW: Check for Pawn Promotion ---
             promotion_choice = None
             piece = self.board_state[src_r][src_c]
@@ -297,18 +365,13 @@ class ChessUI(tk.Tk):
                              (self.player_role == 'black' and dst_r == 7)
 
             if is_pawn and is_last_rank:
-                # Check if this move is legal before asking
-                if (dst_r, dst_c) in self.get_legal_moves(src_r, src_c):
-                    promotion_choice = self.ask_for_promotion()
-                    if not promotion_choice:
-                        # User cancelled promotion
-                        self.selected_square = None
-                        self.update_status_label("Move cancelled.")
-                        self.draw_board()
-                        return
-                else:
-                    # Not a legal move, fall through to server-side fail
-                    pass
+                promotion_choice = self.ask_for_promotion()
+                if not promotion_choice:
+                    # User cancelled promotion
+                    self.selected_square = None
+                    self.update_status_label("Move cancelled.")
+                    self.draw_board()
+                    return
             # --- END NEW ---
 
             # Send move to server
@@ -339,6 +402,8 @@ class ChessUI(tk.Tk):
         try:
             status = message.get("status")
             msg_type = message.get("type")
+            if "legal" in message:
+                self.set_legal_moves(message["legal"])
 
             if status == "joined":
                 self.player_role = message.get("role")
@@ -348,6 +413,67 @@ class ChessUI(tk.Tk):
                 self.title(f"TCP Chess - Playing as {self.player_role.capitalize()}")
                 self.update_status_label(f"Joined as {self.player_role}. Waiting for opponent...", "blue")
                 self.draw_board()
+
+            elif status == "spectating":
+                self.board_state = message.get("board")
+                self.current_turn = message.get("turn")
+                self.title(f"TCP Chess - Watching {message.get('room')}")
+                if message.get("game_over"):
+                    if message.get("reason") == "stalemate":
+                        self.turn_label.config(text="Draw")
+                        self.update_status_label("This game is over: stalemate.", "blue")
+                    else:
+                        winner_name = message.get("winner_name") or (message.get("winner") or "Player").capitalize()
+                        self.turn_label.config(text=f"Winner: {winner_name}")
+                        self.update_status_label(f"This game is over: {winner_name} won.", "blue")
+                else:
+                    self.update_status_label("Watching. Moves appear as they are played.", "blue")
+                    self.update_turn_label()
+                self.draw_board()
+
+            elif status == "resumed":
+                # The connection dropped and came back: replay only the moves we missed
+                self.player_role = message.get("role")
+                if "board" in message:
+                    self.board_state = message.get("board")
+                for from_pos, to_pos, promoted_to in message.get("moves", []):
+                    self.perform_board_move(from_pos, to_pos, promoted_to)
+                self.current_turn = message.get("turn")
+                self.selected_square = None
+                self.legal_moves = []
+                if message.get("game_over"):
+                    if message.get("reason") == "stalemate":
+                        self.turn_label.config(text="Draw")
+                        self.update_status_label("GAME OVER! Stalemate.", "blue")
+                    else:
+                        winner_name = message.get("winner_name", "Player")
+                        self.turn_label.config(text=f"Winner: {winner_name}")
+                        self.update_status_label(f"GAME OVER! {winner_name} wins!", "blue")
+                    self.canvas.unbind("<Button-1>")
+                else:
+                    self.update_turn_label()
+                    self.update_status_label("Reconnected.", "blue")
+                self.draw_board()
+
+            elif msg_type == "SNAPSHOT":
+                # We fell behind and the server skipped us to the current position
+                self.board_state = message.get("board")
+                self.current_turn = message.get("turn")
+                self.selected_square = None
+                self.legal_moves = []
+                if message.get("game_over"):
+                    if message.get("reason") == "stalemate":
+                        self.turn_label.config(text="Draw")
+                        self.update_status_label("GAME OVER! Stalemate.", "blue")
+                    else:
+                        winner_name = message.get("winner_name", "Player")
+                        self.turn_label.config(text=f"Winner: {winner_name}")
+                        self.update_status_label(f"GAME OVER! {winner_name} wins!", "blue")
+                    self.canvas.unbind("<Button-1>")
+                else:
+                    self.update_turn_label()
+                    self.update_status_label("Resynchronised with the server.", "blue")
+                self.draw_board()
             
             # --- MODIFIED: Handle 'promoted_to' and 'names' fields ---
             elif status == "success" or (msg_type == "UPDATE" and message.get("status") == "success"):
@@ -370,6 +496,14 @@ class ChessUI(tk.Tk):
                     # Make the move AND promotion
                     self.perform_board_move(from_pos, to_pos, promoted_to) # MODIFIED
 
+                    if game_over and message.get("reason") == "stalemate":
+                        self.turn_label.config(text="Draw")
+                        self.update_status_label("GAME OVER! Stalemate.", "blue")
+                        self.canvas.unbind("<Button-1>")
+                        self.draw_board()
+                        messagebox.showinfo("Game Over", "Stalemate! The game is a draw.")
+                        return
+
                     if game_over:
                         winner_name = message.get("winner_name", "Player") # <-- NEW
                         self.turn_label.config(text=f"Winner: {winner_name}") # <-- MODIFIED
@@ -458,108 +592,18 @@ class ChessUI(tk.Tk):
         """Returns the full name of a piece character."""
         return PIECE_NAMES.get(piece_char.lower(), 'Piece')
 
-    # --- Legal Move Logic (copied from server/game.py) ---
-    
+    # --- Legal Moves (computed by the server, see protocol.parse_legal_moves) ---
+
+    def set_legal_moves(self, legal):
+        self.move_targets = {}
+        for src, targets in parse_legal_moves(legal).items():
+            self.move_targets[self.algebraic_to_index(src)] = [self.algebraic_to_index(dst) for dst in targets]
+
     def get_legal_moves(self, src_row, src_col):
-        legal_moves = []
         if not self.player_role:
             return []
-            
-        src_alg = self.index_to_algebraic(src_row, src_col)
-
-        for r in range(BOARD_SIZE):
-            for c in range(BOARD_SIZE):
-                if r == src_row and c == src_col:
-                    continue
-                
-                dst_alg = self.index_to_algebraic(r, c)
-                if self.validate_move(src_alg, dst_alg, self.player_role):
-                    legal_moves.append((r, c))
-        return legal_moves
+        return list(self.move_targets.get((src_row, src_col), []))
 
-    def validate_move(self, src, dst, role):
-        try:
-            src_row, src_col = self.algebraic_to_index(src)
-            dst_row, dst_col = self.algebraic_to_index(dst)
-        except Exception:
-            return False # Invalid algebraic notation
-
-        piece = self.board_state[src_row][src_col]
-        if piece == ".":
-            return False
-
-        # Ownership check
-        if role == "white" and not piece.isupper():
-            return False
-        if role == "black" and not piece.islower():
-            return False
-        
-        # Prevent capturing own piece
-        dst_piece = self.board_state[dst_row][dst_col] # <-- FIX: Was self.board
-        if dst_piece != ".":
-            if role == "white" and dst_piece.isupper():
-                return False
-            if role == "black" and dst_piece.islower():
-                return False
-            
-        # Movement logic
-        dr = dst_row - src_row
-        dc = dst_col - src_col
-
-        piece_type = piece.lower()
-
-        if piece_type == "p":  # Pawn
-            direction = -1 if role == "white" else 1
-            start_row = 6 if role == "white" else 1
-
-            # Move forward
-            if dc == 0:
-                if dr == direction and self.board_state[dst_row][dst_col] == ".": # <-- FIX: Was self.board
-                    return True
-                # Check for 2-step move
-                if src_row == start_row and dr == 2 * direction and \
-                   self.board_state[dst_row][dst_col] == "." and \
-                   self.board_state[src_row + direction][dst_col] == ".": # <-- FIX: Was self.board
-                    return True
-
-            # Capture
-            if abs(dc) == 1 and dr == direction and self.board_state[dst_row][dst_col] != ".": # <-- FIX: Was self.board
-                return True
-
-        elif piece_type == "r":  # Rook
-            if dr == 0 or dc == 0:
-                return self.is_path_clear(src_row, src_col, dst_row, dst_col)
-
-        elif piece_type == "n":  # Knight
-            return (abs(dr), abs(dc)) in [(2, 1), (1, 2)]
-
-        elif piece_type == "b":  # Bishop
-            if abs(dr) == abs(dc):
-                return self.is_path_clear(src_row, src_col, dst_row, dst_col)
-
-        elif piece_type == "q":  # Queen
-            if dr == 0 or dc == 0 or abs(dr) == abs(dc):
-                return self.is_path_clear(src_row, src_col, dst_row, dst_col)
-
-        elif piece_type == "k":  # King
-            return abs(dr) <= 1 and abs(dc) <= 1
-
-        return False
-
-    def is_path_clear(self, src_row, src_col, dst_row, dst_col):
-        dr = dst_row - src_row
-        dc = dst_col - src_col
-        steps = max(abs(dr), abs(dc))
-        step_r = dr // steps if steps != 0 else 0
-        step_c = dc // steps if steps != 0 else 0
-
-        for i in range(1, steps):
-            r = src_row + i * step_r
-            c = src_col + i * step_c
-            if self.board_state[r][c] != ".": # <-- FIX: Was self.board
-                return False
-        return True
-    
     def display_coords(self, r, c):
         """Convert board coordinates depending on player side."""
         if self.player_role == "black":
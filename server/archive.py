@@ -0,0 +1,292 @@
+## Game archive
+##
+## Finished games are appended to archive/games.bin, in this layout:
+##
+##   GAME_HEADER  date, result, name lengths, ply count
+##   white, black and room names (UTF-8)
+##   one 16-bit move code per ply (protocol.encode_move)
+##
+## Each game also gets a fixed-size entry in archive/games.idx: its offset in
+## games.bin, its date and 64-bit hashes of the room and both player names.
+## Lookups memory-map the index and scan it with struct.iter_unpack, so finding
+## a player's games among millions never parses a game record. A record is only
+## read, from the memory-mapped games.bin, once its entry matches.
+##
+## With --workers, worker i writes games-i.bin/.idx and readers merge all of them.
+##
+##   python server/archive.py --player alice               # list alice's games
+##   python server/archive.py --since 2024-05-01 --pgn > may.pgn
+
+import argparse
+import glob
+import hashlib
+import heapq
+import mmap
+import os
+import queue
+import struct
+import sys
+import threading
+import time
+from collections import namedtuple
+
+from game import ChessGame, algebraic_to_index
+from log import get_logger
+from protocol import decode_move, encode_move
+
+log = get_logger("archive")
+
+GAME_HEADER = struct.Struct("<IBBBBH")  # date, result, len(white), len(black), len(room), plies
+INDEX_ENTRY = struct.Struct("<QIQQQ")  # offset, date, room key, white key, black key
+MOVE_CODE = struct.Struct("<H")
+
+RESULTS = ("1-0", "0-1", "1/2-1/2")  # Stored as the index into this tuple
+MAX_NAME_BYTES = 255
+UNKNOWN_NAME = "?"  # PGN's placeholder, e.g. for a player of a room recovered from the journal
+
+Game = namedtuple("Game", "date result white black room moves")  # moves: [(src, dst, promotion)]
+
+
+def name_key(name):
+    return int.from_bytes(hashlib.blake2b(name.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def encode_name(name):
+    return name.encode("utf-8")[:MAX_NAME_BYTES].decode("utf-8", "ignore").encode("utf-8")
+
+
+def result_code(room_result):
+    if room_result.get("reason") == "checkmate":
+        return RESULTS.index("1-0" if room_result["winner"] == "white" else "0-1")
+    return RESULTS.index("1/2-1/2")
+
+
+def encode_game(game):
+    white, black, room = (encode_name(name) for name in (game.white, game.black, game.room))
+    parts = [GAME_HEADER.pack(int(game.date), game.result, len(white), len(black), len(room), len(game.moves)),
+             white, black, room]
+    parts.extend(MOVE_CODE.pack(encode_move(*move)) for move in game.moves)
+    return b"".join(parts)
+
+
+def decode_game(data, offset):
+    date, result, white_len, black_len, room_len, plies = GAME_HEADER.unpack_from(data, offset)
+    offset += GAME_HEADER.size
+    names = []
+    for length in (white_len, black_len, room_len):
+        names.append(bytes(data[offset:offset + length]).decode("utf-8"))
+        offset += length
+    moves = [decode_move(code) for (code,) in MOVE_CODE.iter_unpack(data[offset:offset + plies * MOVE_CODE.size])]
+    return Game(date, result, names[0], names[1], names[2], moves)
+
+
+class Archive:
+    """Appends finished games from a background thread, so game over never waits on the disk."""
+
+    def __init__(self, directory, tag=""):
+        os.makedirs(directory, exist_ok=True)
+        suffix = f"-{tag}" if tag != "" else ""
+        self.data_path = os.path.join(directory, f"games{suffix}.bin")
+        self.index_path = os.path.join(directory, f"games{suffix}.idx")
+        self.queue = queue.Queue()
+        threading.Thread(target=self.run, name="archive", daemon=True).start()
+
+    def append(self, room):
+        """Archives room's finished game. Call with the room's lock held."""
+        # Seats, not who is connected now: a player who dropped still played the game
+        self.queue.put(Game(time.time(), result_code(room.result), room.seats.get("white", UNKNOWN_NAME),
+                            room.seats.get("black", UNKNOWN_NAME), room.name, list(room.moves)))
+
+    def run(self):
+        while True:
+            batch = [self.queue.get()]
+            while not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            try:
+                self.write(batch)
+            except Exception as e:  # Whatever went wrong, later games still get archived
+                log.error("archive_write_failed", error=e, games=len(batch))
+
+    def write(self, games):
+        records = []
+        for game in games:
+            try:
+                records.append((game, encode_game(game)))
+            except Exception as e:
+                log.error("archive_bad_game", room=game.room, error=e)
+        if not records:
+            return
+        with open(self.data_path, "ab") as data, open(self.index_path, "ab") as index:
+            offset = data.tell()
+            entries = []
+            for game, record in records:
+                data.write(record)
+                entries.append(INDEX_ENTRY.pack(offset, int(game.date), name_key(game.room),
+                                                name_key(game.white), name_key(game.black)))
+                offset += len(record)
+            # The games are on disk before any index entry points at them
+            data.flush()
+            os.fsync(data.fileno())
+            index.write(b"".join(entries))
+            index.flush()
+            os.fsync(index.fileno())
+        for game, _ in records:
+            log.info("game_archived", room=game.room, result=RESULTS[game.result], plies=len(game.moves))
+
+
+# --- Reading ---
+
+def map_file(path):
+    with open(path, "rb") as handle:
+        if os.fstat(handle.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def iter_archive(data_path, index_path, player=None, room=None, since=None, until=None):
+    """Yields (date, Game) for the matching games in one games.bin/.idx pair, oldest first."""
+    index = map_file(index_path)
+    data = map_file(data_path)
+    usable = len(index) - len(index) % INDEX_ENTRY.size  # Ignores a torn last entry
+    player_key = name_key(player) if player is not None else None
+    room_key = name_key(room) if room is not None else None
+    for offset, date, entry_room, white, black in INDEX_ENTRY.iter_unpack(memoryview(index)[:usable]):
+        if since is not None and date < since or until is not None and date >= until:
+            continue
+        if room_key is not None and entry_room != room_key:
+            continue
+        if player_key is not None and player_key not in (white, black):
+            continue
+        game = decode_game(data, offset)
+        # The keys are hashes: rule out collisions on the real names
+        if room is not None and game.room != room or player is not None and player not in (game.white, game.black):
+            continue
+        yield date, game
+
+
+def find_games(directory, player=None, room=None, since=None, until=None):
+    """Yields every matching game across all workers' archives, oldest first."""
+    sources = []
+    for index_path in sorted(glob.glob(os.path.join(directory, "games*.idx"))):
+        data_path = index_path[:-len(".idx")] + ".bin"
+        if os.path.exists(data_path):
+            sources.append(iter_archive(data_path, index_path, player, room, since, until))
+    for _, game in heapq.merge(*sources, key=lambda item: item[0]):
+        yield game
+
+
+# --- PGN ---
+
+PIECE_LETTERS = {"n": "N", "b": "B", "r": "R", "q": "Q", "k": "K"}
+PGN_LINE_LENGTH = 79
+
+
+def san_moves(moves):
+    """Yields each move of a game from the start position in standard algebraic notation."""
+    board = ChessGame()
+    role = "white"
+    for src, dst, promotion in moves:
+        src_row, src_col = algebraic_to_index(src)
+        dst_row, dst_col = algebraic_to_index(dst)
+        piece = board.piece_at(src_row, src_col)
+        capture = board.piece_at(dst_row, dst_col) != "."
+        if piece in "Pp":
+            san = (src[0] + "x" if capture else "") + dst
+            if dst_row in (0, 7):
+                san += "=" + (promotion or "q").upper()
+        else:
+            # Name the source file, rank or both if another piece of the same kind could go there too
+            rivals = [other for other, target in board.generate_legal_moves(role)
+                      if target == dst and other != src
+                      and board.piece_at(*algebraic_to_index(other)) == piece]
+            prefix = ""
+            if rivals:
+                if all(other[0] != src[0] for other in rivals):
+                    prefix = src[0]
+                elif all(other[1] != src[1] for other in rivals):
+                    prefix = src[1]
+                else:
+                    prefix = src
+            san = PIECE_LETTERS[piece.lower()] + prefix + ("x" if capture else "") + dst
+        board.push((src, dst, promotion), record=False)
+        role = "black" if role == "white" else "white"
+        if board.is_in_check(role):
+            san += "+" if board.has_legal_move(role) else "#"
+        yield san
+
+
+def pgn_tag(name, value):
+    value = value.replace("\\", "\\\\").replace('"', '\\"')
+    return f'[{name} "{value}"]'
+
+
+def game_to_pgn(game):
+    result = RESULTS[game.result]
+    tags = [("Event", "TCP Chess"), ("Site", game.room),
+            ("Date", time.strftime("%Y.%m.%d", time.localtime(game.date))), ("Round", "-"),
+            ("White", game.white), ("Black", game.black), ("Result", result)]
+    lines = [pgn_tag(name, value) for name, value in tags]
+    lines.append("")
+    line = ""
+    tokens = []
+    for ply, san in enumerate(san_moves(game.moves)):
+        tokens.append(f"{ply // 2 + 1}. {san}" if ply % 2 == 0 else san)
+    tokens.append(result)
+    for token in tokens:
+        if line and len(line) + 1 + len(token) > PGN_LINE_LENGTH:
+            lines.append(line)
+            line = token
+        else:
+            line = f"{line} {token}" if line else token
+    lines.append(line)
+    return "\n".join(lines) + "\n\n"
+
+
+def export_pgn(games, out):
+    """Writes games as PGN one at a time, so the whole archive is never in memory."""
+    count = 0
+    for game in games:
+        out.write(game_to_pgn(game))
+        count += 1
+    return count
+
+
+def parse_date(text):
+    return int(time.mktime(time.strptime(text, "%Y-%m-%d"))) if text else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search the finished-game archive or export it as PGN")
+    parser.add_argument("--dir", default="archive", help="archive directory (default: archive)")
+    parser.add_argument("--player", help="games where this player had either colour")
+    parser.add_argument("--room", help="games played in this room")
+    parser.add_argument("--since", help="games finished on or after this date (YYYY-MM-DD)")
+    parser.add_argument("--until", help="games finished before this date (YYYY-MM-DD)")
+    parser.add_argument("--pgn", action="store_true", help="write the games as PGN instead of listing them")
+    parser.add_argument("--out", help="file to write to (default: stdout)")
+    args = parser.parse_args()
+
+    try:
+        since, until = parse_date(args.since), parse_date(args.until)
+    except ValueError as e:
+        parser.error(str(e))
+    games = find_games(args.dir, args.player, args.room, since, until)
+    out = open(args.out, "w", encoding="utf-8") if args.out else sys.stdout
+    try:
+        if args.pgn:
+            count = export_pgn(games, out)
+        else:
+            count = 0
+            for game in games:
+                out.write(f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(game.date))}  "
+                          f"{game.room}  {game.white} vs {game.black}  {RESULTS[game.result]}  "
+                          f"{len(game.moves)} plies\n")
+                count += 1
+    finally:
+        if args.out:
+            out.close()
+    print(f"{count} games", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
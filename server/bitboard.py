@@ -0,0 +1,523 @@
+## Bitboard Chess Game
+##
+## Same rules and public contract as game.ChessGame, but the position is kept as
+## one 64-bit integer per piece type and color. Square index 0 is a8, 63 is h1,
+## so index = row * 8 + col matches the row/col layout used by ChessGame.
+
+from zobrist import PIECE_KEYS
+from log import DEBUG, get_logger
+
+log = get_logger("engine")
+
+WHITE = 0
+BLACK = 1
+
+PIECE_TYPES = "pnbrqk"
+PIECE_CHARS = (PIECE_TYPES.upper(), PIECE_TYPES)
+
+SQUARE_INDEX = {
+    chr(ord('a') + col) + str(8 - row): row * 8 + col
+    for row in range(8) for col in range(8)
+}
+SQUARE_NAMES = sorted(SQUARE_INDEX, key=SQUARE_INDEX.get)  # By square index
+
+ALL_SQUARES = (1 << 64) - 1
+FILE_A = sum(1 << (row * 8) for row in range(8))
+FILE_H = FILE_A << 7
+DOUBLE_PUSH_RANKS = (0xFF << 40, 0xFF << 16)  # Where each side's pawns land after one step from home
+
+
+def _build_step_table(offsets):
+    table = []
+    for sq in range(64):
+        row, col = divmod(sq, 8)
+        bb = 0
+        for dr, dc in offsets:
+            r, c = row + dr, col + dc
+            if 0 <= r < 8 and 0 <= c < 8:
+                bb |= 1 << (r * 8 + c)
+        table.append(bb)
+    return table
+
+
+def _build_ray_table(dr, dc):
+    table = []
+    for sq in range(64):
+        row, col = divmod(sq, 8)
+        bb = 0
+        r, c = row + dr, col + dc
+        while 0 <= r < 8 and 0 <= c < 8:
+            bb |= 1 << (r * 8 + c)
+            r, c = r + dr, c + dc
+        table.append(bb)
+    return table
+
+
+KNIGHT_ATTACKS = _build_step_table([(2, 1), (1, 2), (-1, 2), (-2, 1),
+                                    (-2, -1), (-1, -2), (1, -2), (2, -1)])
+KING_ATTACKS = _build_step_table([(1, 1), (1, 0), (1, -1), (0, 1),
+                                  (0, -1), (-1, 1), (-1, 0), (-1, -1)])
+# White pawns move towards row 0, black pawns towards row 7.
+PAWN_ATTACKS = (
+    _build_step_table([(-1, -1), (-1, 1)]),
+    _build_step_table([(1, -1), (1, 1)]),
+)
+
+# Rays are split by whether the square index grows along them, so the nearest
+# blocker is the lowest set bit (increasing) or the highest set bit (decreasing).
+ROOK_RAYS_UP = [_build_ray_table(0, 1), _build_ray_table(1, 0)]
+ROOK_RAYS_DOWN = [_build_ray_table(0, -1), _build_ray_table(-1, 0)]
+BISHOP_RAYS_UP = [_build_ray_table(1, 1), _build_ray_table(1, -1)]
+BISHOP_RAYS_DOWN = [_build_ray_table(-1, -1), _build_ray_table(-1, 1)]
+
+
+EAST, SOUTH = ROOK_RAYS_UP
+WEST, NORTH = ROOK_RAYS_DOWN
+SOUTH_EAST, SOUTH_WEST = BISHOP_RAYS_UP
+NORTH_WEST, NORTH_EAST = BISHOP_RAYS_DOWN
+
+# The four rays are written out rather than looped over: these run for every slider in search
+
+
+def rook_attacks(sq, occ):
+    east = EAST[sq]
+    blockers = east & occ
+    if blockers:
+        east ^= EAST[(blockers & -blockers).bit_length() - 1]
+    south = SOUTH[sq]
+    blockers = south & occ
+    if blockers:
+        south ^= SOUTH[(blockers & -blockers).bit_length() - 1]
+    west = WEST[sq]
+    blockers = west & occ
+    if blockers:
+        west ^= WEST[blockers.bit_length() - 1]
+    north = NORTH[sq]
+    blockers = north & occ
+    if blockers:
+        north ^= NORTH[blockers.bit_length() - 1]
+    return east | south | west | north
+
+
+def bishop_attacks(sq, occ):
+    south_east = SOUTH_EAST[sq]
+    blockers = south_east & occ
+    if blockers:
+        south_east ^= SOUTH_EAST[(blockers & -blockers).bit_length() - 1]
+    south_west = SOUTH_WEST[sq]
+    blockers = south_west & occ
+    if blockers:
+        south_west ^= SOUTH_WEST[(blockers & -blockers).bit_length() - 1]
+    north_west = NORTH_WEST[sq]
+    blockers = north_west & occ
+    if blockers:
+        north_west ^= NORTH_WEST[blockers.bit_length() - 1]
+    north_east = NORTH_EAST[sq]
+    blockers = north_east & occ
+    if blockers:
+        north_east ^= NORTH_EAST[blockers.bit_length() - 1]
+    return south_east | south_west | north_west | north_east
+
+
+def _build_between_table():
+    """BETWEEN[a * 64 + b]: the squares strictly between a and b if they share a line, else 0."""
+    table = [0] * 4096
+    for sq in range(64):
+        for rays in ROOK_RAYS_UP + ROOK_RAYS_DOWN + BISHOP_RAYS_UP + BISHOP_RAYS_DOWN:
+            ray = rays[sq]
+            for target in iter_bits(ray):
+                table[sq * 64 + target] = ray & ~rays[target] & ~(1 << target)
+    return table
+
+
+# Every square a rook or bishop on sq could reach on an empty board
+ROOK_LINES = [rook_attacks(sq, 0) for sq in range(64)]
+BISHOP_LINES = [bishop_attacks(sq, 0) for sq in range(64)]
+
+
+def iter_bits(bb):
+    while bb:
+        low = bb & -bb
+        yield low.bit_length() - 1
+        bb ^= low
+
+
+BETWEEN = _build_between_table()
+
+INITIAL_BOARD = [
+    ["r", "n", "b", "q", "k", "b", "n", "r"],
+    ["p", "p", "p", "p", "p", "p", "p", "p"],
+    [".", ".", ".", ".", ".", ".", ".", "."],
+    [".", ".", ".", ".", ".", ".", ".", "."],
+    [".", ".", ".", ".", ".", ".", ".", "."],
+    [".", ".", ".", ".", ".", ".", ".", "."],
+    ["P", "P", "P", "P", "P", "P", "P", "P"],
+    ["R", "N", "B", "Q", "K", "B", "N", "R"]
+]
+
+
+class BitboardGame:
+
+    PIECE_NAMES = {'q': 'Queen', 'r': 'Rook', 'b': 'Bishop', 'n': 'Knight'}
+
+    def __init__(self):
+        self.set_board(INITIAL_BOARD)
+
+    def set_board(self, board):
+        """Replaces the position with an 8x8 board of piece characters, like ChessGame.set_board."""
+        # pieces[color][type] -> bitboard, type in PIECE_TYPES order
+        self.pieces = [[0] * 6, [0] * 6]
+        self.occupied = [0, 0]
+        self.zobrist = 0
+        self.move_stack = []  # (src_sq, dst_sq, piece_type, captured_type, promoted_type) of push()es, -1 for none
+        for row in range(8):
+            for col in range(8):
+                char = board[row][col]
+                if char != ".":
+                    self._put(row * 8 + col, char)
+
+    def _put(self, sq, char):
+        color = WHITE if char.isupper() else BLACK
+        bit = 1 << sq
+        self.pieces[color][PIECE_TYPES.index(char.lower())] |= bit
+        self.occupied[color] |= bit
+        self.zobrist ^= PIECE_KEYS[char][sq]
+
+    def piece_at(self, sq):
+        bit = 1 << sq
+        for color in (WHITE, BLACK):
+            if self.occupied[color] & bit:
+                for index, bb in enumerate(self.pieces[color]):
+                    if bb & bit:
+                        char = PIECE_TYPES[index]
+                        return char.upper() if color == WHITE else char
+        return "."
+
+    def get_board(self):
+        squares = ["."] * 64
+        for color in (WHITE, BLACK):
+            for char, bb in zip(PIECE_CHARS[color], self.pieces[color]):
+                while bb:
+                    low = bb & -bb
+                    squares[low.bit_length() - 1] = char
+                    bb ^= low
+        return [squares[i:i + 8] for i in range(0, 64, 8)]
+
+    def print_board(self):
+        for row in self.get_board():
+            print(" ".join(row))
+        print()
+
+    def make_move(self, src, dst, role, promotion_to=None):
+        """
+        Attempts to make a move.
+        Returns: (bool: success, str: captured_piece, str: promoted_char)
+        """
+        if not self.validate_move(src, dst, role):
+            log.debug("invalid_move", role=role, src=src, dst=dst)
+            return (False, None, None) # (Success, Captured, Promoted)
+
+        src_sq = SQUARE_INDEX[src]
+        piece = self.piece_at(src_sq)
+        captured_piece, promoted_char = self.push_squares(src_sq, SQUARE_INDEX[dst], promotion_to, record=False)
+
+        log.debug("move", role=role, piece=piece, src=src, dst=dst)
+
+        if promoted_char:
+            if promotion_to and promotion_to.lower() in self.PIECE_NAMES:
+                log.debug("promotion", piece=promoted_char)
+            else:
+                log.debug("promotion", piece=promoted_char, default=True)
+
+        if log.enabled(DEBUG):
+            log.debug("board", rows="/".join("".join(row) for row in self.get_board()))
+        return (True, captured_piece, promoted_char)
+
+    # --- Make / Unmake ---
+
+    def push(self, move, record=True):
+        """
+        Applies move = (src, dst) or (src, dst, promotion) without validating it.
+        Returns (captured_piece, promoted_char); pop() takes it back. With
+        record=False nothing is kept for pop(), for moves that stay played.
+        """
+        promotion_to = move[2] if len(move) > 2 else None
+        return self.push_squares(SQUARE_INDEX[move[0]], SQUARE_INDEX[move[1]], promotion_to, record)
+
+    def push_squares(self, src_sq, dst_sq, promotion_to=None, record=True):
+        src_bit = 1 << src_sq
+        dst_bit = 1 << dst_sq
+        color = WHITE if self.occupied[WHITE] & src_bit else BLACK
+        enemy = 1 - color
+
+        piece_type = self.type_at(color, src_bit)
+        captured_type = self.type_at(enemy, dst_bit)
+
+        # A pawn reaching the last rank always promotes, to a queen unless told otherwise
+        promoted_type = -1
+        if piece_type == 0 and (dst_sq < 8 or dst_sq >= 56):
+            if promotion_to and promotion_to.lower() in self.PIECE_NAMES:
+                promoted_type = PIECE_TYPES.index(promotion_to.lower())
+            else:
+                promoted_type = 4
+
+        move = (src_sq, dst_sq, piece_type, captured_type, promoted_type)
+        if record:
+            self.move_stack.append(move)
+        self.apply(color, move)
+
+        captured = "." if captured_type < 0 else PIECE_CHARS[enemy][captured_type]
+        promoted = None if promoted_type < 0 else PIECE_CHARS[color][promoted_type]
+        return captured, promoted
+
+    def pop(self):
+        """Takes back the last pushed move and returns it as (src, dst, promoted_char)."""
+        move = self.move_stack.pop()
+        src_sq, dst_sq, _, _, promoted_type = move
+        color = WHITE if self.occupied[WHITE] & (1 << dst_sq) else BLACK
+        # Every change is an XOR, so applying the move again reverts it
+        self.apply(color, move)
+        promoted = None if promoted_type < 0 else PIECE_CHARS[color][promoted_type]
+        return (SQUARE_NAMES[src_sq], SQUARE_NAMES[dst_sq], promoted)
+
+    def apply(self, color, move):
+        src_sq, dst_sq, piece_type, captured_type, promoted_type = move
+        self.toggle(color, piece_type, src_sq)
+        if captured_type >= 0:
+            self.toggle(1 - color, captured_type, dst_sq)
+        self.toggle(color, piece_type if promoted_type < 0 else promoted_type, dst_sq)
+
+    def toggle(self, color, piece_type, sq):
+        bit = 1 << sq
+        self.pieces[color][piece_type] ^= bit
+        self.occupied[color] ^= bit
+        self.zobrist ^= PIECE_KEYS[PIECE_CHARS[color][piece_type]][sq]
+
+    def type_at(self, color, bit):
+        if self.occupied[color] & bit:
+            for index, bb in enumerate(self.pieces[color]):
+                if bb & bit:
+                    return index
+        return -1
+
+    # --- END Make / Unmake ---
+
+    def is_piece_owned_by(self, square, role):
+        sq = SQUARE_INDEX.get(square)
+        if sq is None:
+            return False
+        color = WHITE if role == "white" else BLACK
+        return bool(self.occupied[color] & (1 << sq))
+
+    def pseudo_targets(self, sq, color):
+        """Bitboard of squares the piece on sq may move to, ignoring king safety."""
+        bit = 1 << sq
+        own = self.occupied[color]
+        enemy_occ = self.occupied[1 - color]
+        occ = own | enemy_occ
+        pieces = self.pieces[color]
+
+        if pieces[0] & bit:  # Pawn
+            if color == WHITE:
+                single = (bit >> 8) & ~occ
+                double = (single >> 8) & ~occ if 48 <= sq < 56 else 0
+            else:
+                single = (bit << 8) & ~occ
+                double = (single << 8) & ~occ if 8 <= sq < 16 else 0
+            return (single | double | (PAWN_ATTACKS[color][sq] & enemy_occ)) & ALL_SQUARES
+        if pieces[1] & bit:
+            targets = KNIGHT_ATTACKS[sq]
+        elif pieces[2] & bit:
+            targets = bishop_attacks(sq, occ)
+        elif pieces[3] & bit:
+            targets = rook_attacks(sq, occ)
+        elif pieces[4] & bit:
+            targets = rook_attacks(sq, occ) | bishop_attacks(sq, occ)
+        else:
+            targets = KING_ATTACKS[sq]
+        return targets & ~own
+
+    def attacked(self, sq, by_color, occ, removed=0):
+        """True if by_color attacks sq given occupancy occ, ignoring pieces on removed."""
+        pieces = self.pieces[by_color]
+        keep = ~removed
+        if KNIGHT_ATTACKS[sq] & pieces[1] & keep:
+            return True
+        if KING_ATTACKS[sq] & pieces[5] & keep:
+            return True
+        if PAWN_ATTACKS[1 - by_color][sq] & pieces[0] & keep:
+            return True
+        if rook_attacks(sq, occ) & (pieces[3] | pieces[4]) & keep:
+            return True
+        if bishop_attacks(sq, occ) & (pieces[2] | pieces[4]) & keep:
+            return True
+        return False
+
+    def leaves_king_safe(self, src_sq, dst_sq, color):
+        src_bit = 1 << src_sq
+        dst_bit = 1 << dst_sq
+        occ = ((self.occupied[WHITE] | self.occupied[BLACK]) & ~src_bit) | dst_bit
+        king = self.pieces[color][5]
+        king_sq = dst_sq if king & src_bit else king.bit_length() - 1
+        return not self.attacked(king_sq, 1 - color, occ, removed=dst_bit)
+
+    def validate_move(self, src, dst, role, skip_self_check=False):
+        src_sq = SQUARE_INDEX.get(src)
+        dst_sq = SQUARE_INDEX.get(dst)
+        if src_sq is None or dst_sq is None:
+            return False
+
+        color = WHITE if role == "white" else BLACK
+        if not self.occupied[color] & (1 << src_sq):
+            return False
+        if not self.pseudo_targets(src_sq, color) & (1 << dst_sq):
+            return False
+
+        if not skip_self_check and not self.leaves_king_safe(src_sq, dst_sq, color):
+            return False
+        return True
+
+    def is_checkmate(self, role):
+        if not self.is_in_check(role):
+            return False  # must be in check
+        return not self.has_legal_move(role)  # No escape → checkmate
+
+    def is_stalemate(self, role):
+        if self.is_in_check(role):
+            return False
+        return not self.has_legal_move(role)
+
+    def generate_legal_moves(self, role):
+        """Every legal move for role as a list of (src, dst) algebraic pairs, like ChessGame."""
+        return [(SQUARE_NAMES[src_sq], SQUARE_NAMES[dst_sq])
+                for src_sq, dst_sq in self.legal_move_squares(role)]
+
+    def has_legal_move(self, role):
+        return bool(self.legal_move_squares(role))
+
+    def legal_move_squares(self, role):
+        """
+        Legal moves as a list of (src_sq, dst_sq) square indexes. Like ChessGame,
+        it works out checks and pins once per position instead of testing king
+        safety after every candidate move, and it walks each piece type's bits
+        inline: this is the hottest loop in search.
+        """
+        color = WHITE if role == "white" else BLACK
+        own = self.occupied[color]
+        enemy_occ = self.occupied[1 - color]
+        occ = own | enemy_occ
+        pieces = self.pieces[color]
+        their = self.pieces[1 - color]
+        king = pieces[5]
+        king_sq = king.bit_length() - 1
+        rook_like = their[3] | their[4]
+        bishop_like = their[2] | their[4]
+        moves = []
+        append = moves.append
+
+        # Enemy attacks seen through the king, so it can't step back along a checking line
+        targets = KING_ATTACKS[king_sq] & ~own & ~self.attack_map(1 - color, occ ^ king)
+        while targets:
+            bit = targets & -targets
+            targets ^= bit
+            append((king_sq, bit.bit_length() - 1))
+
+        checkers = ((KNIGHT_ATTACKS[king_sq] & their[1]) | (PAWN_ATTACKS[color][king_sq] & their[0])
+                    | (rook_attacks(king_sq, occ) & rook_like) | (bishop_attacks(king_sq, occ) & bishop_like))
+        if checkers & (checkers - 1):
+            return moves  # Double check: only the king can move
+        # A non-king move must capture a single checker or block its line
+        allowed = ~own & ALL_SQUARES
+        if checkers:
+            allowed &= checkers | BETWEEN[king_sq * 64 + checkers.bit_length() - 1]
+
+        # Own pieces alone between the king and an enemy slider may only move along that line
+        pins = {}
+        for sniper in iter_bits((ROOK_LINES[king_sq] & rook_like) | (BISHOP_LINES[king_sq] & bishop_like)):
+            line = BETWEEN[king_sq * 64 + sniper]
+            blockers = line & occ
+            if blockers & own and not blockers & (blockers - 1):
+                pins[blockers.bit_length() - 1] = line | (1 << sniper)
+
+        # Unpinned pawns all move at once; each target bit is offset squares from its pawn
+        pinned = 0
+        for sq in pins:
+            pinned |= 1 << sq
+        pawns = pieces[0] & ~pinned
+        empty = ~occ & ALL_SQUARES
+        if color == WHITE:
+            single = (pawns >> 8) & empty
+            pawn_moves = ((single, 8), (((single & DOUBLE_PUSH_RANKS[WHITE]) >> 8) & empty, 16),
+                          ((pawns >> 9) & ~FILE_H & enemy_occ, 9), ((pawns >> 7) & ~FILE_A & enemy_occ, 7))
+        else:
+            single = (pawns << 8) & empty
+            pawn_moves = ((single, -8), (((single & DOUBLE_PUSH_RANKS[BLACK]) << 8) & empty, -16),
+                          ((pawns << 7) & ~FILE_H & enemy_occ, -7), ((pawns << 9) & ~FILE_A & enemy_occ, -9))
+        for targets, offset in pawn_moves:
+            targets &= allowed
+            while targets:
+                bit = targets & -targets
+                targets ^= bit
+                dst_sq = bit.bit_length() - 1
+                append((dst_sq + offset, dst_sq))
+
+        for piece_type in range(5):
+            sources = pieces[piece_type]
+            if piece_type == 0:
+                sources &= pinned
+            while sources:
+                low = sources & -sources
+                sources ^= low
+                src_sq = low.bit_length() - 1
+                if piece_type == 0:
+                    targets = self.pseudo_targets(src_sq, color)
+                elif piece_type == 1:
+                    targets = KNIGHT_ATTACKS[src_sq]
+                elif piece_type == 2:
+                    targets = bishop_attacks(src_sq, occ)
+                elif piece_type == 3:
+                    targets = rook_attacks(src_sq, occ)
+                else:
+                    targets = rook_attacks(src_sq, occ) | bishop_attacks(src_sq, occ)
+                targets &= allowed
+                if src_sq in pins:
+                    targets &= pins[src_sq]
+                while targets:
+                    bit = targets & -targets
+                    targets ^= bit
+                    append((src_sq, bit.bit_length() - 1))
+        return moves
+
+    def attack_map(self, color, occ):
+        """Bitboard of every square color's pieces attack, given occupancy occ."""
+        pieces = self.pieces[color]
+        # All pawns at once: a capture towards the a-file can't land on the h-file, and vice versa
+        pawns = pieces[0]
+        if color == WHITE:
+            attacks = ((pawns >> 9) & ~FILE_H) | ((pawns >> 7) & ~FILE_A)
+        else:
+            attacks = (((pawns << 7) & ~FILE_H) | ((pawns << 9) & ~FILE_A)) & ALL_SQUARES
+        for sq in iter_bits(pieces[1]):
+            attacks |= KNIGHT_ATTACKS[sq]
+        for sq in iter_bits(pieces[2] | pieces[4]):
+            attacks |= bishop_attacks(sq, occ)
+        for sq in iter_bits(pieces[3] | pieces[4]):
+            attacks |= rook_attacks(sq, occ)
+        return attacks | KING_ATTACKS[pieces[5].bit_length() - 1]
+
+    def find_king(self, role):
+        color = WHITE if role == "white" else BLACK
+        king = self.pieces[color][5]
+        if not king:
+            return None
+        return divmod(king.bit_length() - 1, 8)
+
+    def is_square_attacked(self, row, col, by_role):
+        by_color = WHITE if by_role == "white" else BLACK
+        occ = self.occupied[WHITE] | self.occupied[BLACK]
+        return self.attacked(row * 8 + col, by_color, occ)
+
+    def is_in_check(self, role):
+        king_row, king_col = self.find_king(role)
+        opponent = "white" if role == "black" else "black"
+        return self.is_square_attacked(king_row, king_col, opponent)
@@ -1,31 +1,136 @@
 ## Basic Chess Game
+##
+## The position is a 64-byte bytearray holding one ASCII piece letter per square
+## ("." when empty), indexed row * 8 + col with 0 = a8, as in zobrist.py. The
+## incremental attack maps are flat too: attack_counts holds white's then black's
+## attacker count per square in one bytearray, and attacked_by is an array of
+## 64-bit masks of attacking squares per square.
+## What each piece attacks is recomputed from the board and the per-square tables
+## shared by every game rather than stored, and kings are found with one find()
+## over the bytes. With __slots__ a game is a handful of small buffers and
+## copy() is a few memcpys. Only push() keeps undo records, for search; moves
+## that are never taken back (make_move, replays) leave none.
+
+from array import array
+
+from zobrist import PIECE_KEYS, hash_board
+from log import DEBUG, get_logger
+
+log = get_logger("engine")
 
 def algebraic_to_index(square):
         col = ord(square[0].lower()) - ord('a')
         row = 8 - int(square[1])
         return row, col
 
+def index_to_algebraic(row, col):
+        return chr(col + ord('a')) + str(8 - row)
+
+KNIGHT_STEPS = [(2, 1), (1, 2), (-1, 2), (-2, 1), (-2, -1), (-1, -2), (1, -2), (2, -1)]
+KING_STEPS = [(1, 1), (1, 0), (1, -1), (0, 1), (0, -1), (-1, 1), (-1, 0), (-1, -1)]
+ROOK_DIRECTIONS = [(1, 0), (-1, 0), (0, 1), (0, -1)]
+BISHOP_DIRECTIONS = [(1, 1), (1, -1), (-1, 1), (-1, -1)]
+
+START_BOARD = ["rnbqkbnr", "pppppppp", "........", "........",
+               "........", "........", "PPPPPPPP", "RNBQKBNR"]
+
+# Squares hold piece letters as bytes; piece | 32 lower-cases one
+EMPTY = ord(".")
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = (ord(kind) for kind in "pnbrqk")
+WHITE_PIECES = frozenset(b"PNBRQK")
+BLACK_PIECES = frozenset(b"pnbrqk")
+SLIDERS = frozenset((BISHOP, ROOK, QUEEN))
+KING_BYTES = {"white": ord("K"), "black": ord("k")}
+COUNT_OFFSETS = {"white": 0, "black": 64}  # Where each side's counts start in attack_counts
+
+SQUARE_NAMES = [index_to_algebraic(sq // 8, sq % 8) for sq in range(64)]
+
+# Zobrist keys by piece byte
+BYTE_KEYS = [None] * 128
+for _piece, _keys in PIECE_KEYS.items():
+    BYTE_KEYS[ord(_piece)] = _keys
+
+
+def _steps_from(sq, steps):
+    row, col = divmod(sq, 8)
+    return tuple((row + dr) * 8 + col + dc for dr, dc in steps if 0 <= row + dr < 8 and 0 <= col + dc < 8)
+
+def _ray(sq, dr, dc):
+    row, col = divmod(sq, 8)
+    ray = []
+    row, col = row + dr, col + dc
+    while 0 <= row < 8 and 0 <= col < 8:
+        ray.append(row * 8 + col)
+        row, col = row + dr, col + dc
+    return tuple(ray)
+
+# Per-square target tables, shared by every game
+KNIGHT_TARGETS = [_steps_from(sq, KNIGHT_STEPS) for sq in range(64)]
+KING_TARGETS = [_steps_from(sq, KING_STEPS) for sq in range(64)]
+PAWN_ATTACKS = {
+    True: [_steps_from(sq, [(-1, -1), (-1, 1)]) for sq in range(64)],  # White
+    False: [_steps_from(sq, [(1, -1), (1, 1)]) for sq in range(64)],
+}
+ROOK_RAYS = [tuple(_ray(sq, dr, dc) for dr, dc in ROOK_DIRECTIONS) for sq in range(64)]
+BISHOP_RAYS = [tuple(_ray(sq, dr, dc) for dr, dc in BISHOP_DIRECTIONS) for sq in range(64)]
+SLIDER_RAYS = {
+    ROOK: ROOK_RAYS,
+    BISHOP: BISHOP_RAYS,
+    QUEEN: [ROOK_RAYS[sq] + BISHOP_RAYS[sq] for sq in range(64)],
+}
+# BEYOND[a * 64 + b]: the squares past b on the line from a, for a and b on a shared line
+BEYOND = [()] * 4096
+for _sq in range(64):
+    for _ray_squares in SLIDER_RAYS[QUEEN][_sq]:
+        for _i, _target in enumerate(_ray_squares):
+            BEYOND[_sq * 64 + _target] = _ray_squares[_i + 1:]
+MASK64 = (1 << 64) - 1
+
 class ChessGame:
 
+    PIECE_NAMES = {'q': 'Queen', 'r': 'Rook', 'b': 'Bishop', 'n': 'Knight'}
+
+    __slots__ = ("squares", "move_stack", "zobrist", "attacked_by", "attack_counts")
+
     def __init__(self):
-        self.board = [
-            ["r", "n", "b", "q", "k", "b", "n", "r"],
-            ["p", "p", "p", "p", "p", "p", "p", "p"],
-            [".", ".", ".", ".", ".", ".", ".", "."],
-            [".", ".", ".", ".", ".", ".", ".", "."],
-            [".", ".", ".", ".", ".", ".", ".", "."],
-            [".", ".", ".", ".", ".", ".", ".", "."],
-            ["P", "P", "P", "P", "P", "P", "P", "P"],
-            ["R", "N", "B", "Q", "K", "B", "N", "R"]
-        ]
-        self.PIECE_NAMES = {'q': 'Queen', 'r': 'Rook', 'b': 'Bishop', 'n': 'Knight'}
+        self.set_board(START_BOARD)
 
+    def set_board(self, board):
+        """
+        Replaces the position and rebuilds the incremental state from it:
+        the Zobrist hash, and for every square the pieces attacking it plus a
+        per-side attacker count.
+        All later changes to self.squares must go through set_square.
+        """
+        self.squares = bytearray("".join("".join(row) for row in board), "ascii")
+        self.move_stack = []  # (src, dst, piece, captured, promoted) of push()es not yet popped
+        self.zobrist = hash_board(board)
+        self.attacked_by = array("Q", bytes(512))  # Mask of the squares whose pieces attack each square
+        self.attack_counts = bytearray(128)
+        for sq in range(64):
+            if self.squares[sq] != EMPTY:
+                self.add_attacks(sq)
+
+    def copy(self):
+        """An independent game in the same position."""
+        other = ChessGame.__new__(ChessGame)
+        other.squares = bytearray(self.squares)
+        other.move_stack = list(self.move_stack)
+        other.zobrist = self.zobrist
+        other.attacked_by = array("Q", self.attacked_by)
+        other.attack_counts = bytearray(self.attack_counts)
+        return other
 
     def get_board(self):
-        return self.board
-    
+        """The position as 8 lists of 8 one-character strings, built on each call."""
+        text = self.squares.decode("ascii")
+        return [list(text[i:i + 8]) for i in range(0, 64, 8)]
+
+    def piece_at(self, row, col):
+        return chr(self.squares[row * 8 + col])
+
     def print_board(self):
-        for row in self.board:
+        for row in self.get_board():
             print(" ".join(row))
         print()
 
@@ -35,59 +140,52 @@ class ChessGame:
         Returns: (bool: success, str: captured_piece, str: promoted_char)
         """
         if not self.validate_move(src, dst, role):
-            print(f"Invalid move for {role}: {src} to {dst}")
+            log.debug("invalid_move", role=role, src=src, dst=dst)
             return (False, None, None) # (Success, Captured, Promoted)
-    
+
         src_row, src_col = algebraic_to_index(src)
         dst_row, dst_col = algebraic_to_index(dst)
-    
-        piece = self.board[src_row][src_col]
-        captured_piece = self.board[dst_row][dst_col] # Get piece at destination
-        
-        self.board[dst_row][dst_col] = piece
-        self.board[src_row][src_col] = "."
-    
-        print(f"{role} moved {piece} from {src} to {dst}")
-        
-        # --- Handle Promotion Logic ---
-        promoted_char = None
-        is_pawn = piece.lower() == 'p'
-        is_last_rank = (role == 'white' and dst_row == 0) or (role == 'black' and dst_row == 7)
-        
-        if is_pawn and is_last_rank:
+
+        piece = self.piece_at(src_row, src_col)
+        captured_piece, promoted_char = self.push_squares(src_row * 8 + src_col, dst_row * 8 + dst_col,
+                                                          promotion_to, record=False)
+
+        log.debug("move", role=role, piece=piece, src=src, dst=dst)
+
+        # --- Promotion is applied by push_squares ---
+        if promoted_char:
             if promotion_to and promotion_to.lower() in self.PIECE_NAMES:
-                promoted_char = promotion_to.upper() if role == 'white' else promotion_to.lower()
-                self.board[dst_row][dst_col] = promoted_char
-                print(f"Pawn promoted to {promoted_char}!")
+                log.debug("promotion", piece=promoted_char)
             else:
                 # This is a server-side fallback, but client should always ask.
-                promoted_char = 'Q' if role == 'white' else 'q'
-                self.board[dst_row][dst_col] = promoted_char
-                print(f"Pawn promoted to {promoted_char} (default)!")
+                log.debug("promotion", piece=promoted_char, default=True)
         # --- END Promotion ---
 
-        self.print_board()
+        if log.enabled(DEBUG):
+            log.debug("board", rows="/".join("".join(row) for row in self.get_board()))
         return (True, captured_piece, promoted_char) # Return success, captured, and promoted
-    
-    
+
+
     def is_piece_owned_by(self, square, role):
         row, col = algebraic_to_index(square)
-        piece = self.board[row][col]
+        piece = self.piece_at(row, col)
         if piece == ".":
             return False
         if role == "white":
             return piece.isupper()
         else:
             return piece.islower()
-        
+
     def validate_move(self, src, dst, role, skip_self_check=False):
         try:
             src_row, src_col = algebraic_to_index(src)
             dst_row, dst_col = algebraic_to_index(dst)
         except Exception:
             return False
+        if not (0 <= src_row < 8 and 0 <= src_col < 8 and 0 <= dst_row < 8 and 0 <= dst_col < 8):
+            return False
 
-        piece = self.board[src_row][src_col]
+        piece = self.piece_at(src_row, src_col)
         if piece == ".":
             return False
 
@@ -98,7 +196,7 @@ class ChessGame:
             return False
 
         # Prevent capturing own piece
-        dst_piece = self.board[dst_row][dst_col]
+        dst_piece = self.piece_at(dst_row, dst_col)
         if dst_piece != ".":
             if role == "white" and dst_piece.isupper():
                 return False
@@ -117,17 +215,17 @@ class ChessGame:
             start_row = 6 if role == "white" else 1
 
             # 1-square forward
-            if dc == 0 and dr == direction and self.board[dst_row][dst_col] == ".":
+            if dc == 0 and dr == direction and dst_piece == ".":
                 move_is_legal = True
 
             # 2-square forward
             if (dc == 0 and src_row == start_row and dr == 2 * direction and
-                self.board[dst_row][dst_col] == "." and
-                self.board[src_row + direction][dst_col] == "."):
+                dst_piece == "." and
+                self.piece_at(src_row + direction, dst_col) == "."):
                 move_is_legal = True
 
             # Capture
-            if abs(dc) == 1 and dr == direction and self.board[dst_row][dst_col] != ".":
+            if abs(dc) == 1 and dr == direction and dst_piece != ".":
                 move_is_legal = True
 
         elif piece_type == "r":  # Rook
@@ -158,64 +256,313 @@ class ChessGame:
 
         # --- KING SAFETY CHECK ---
         if not skip_self_check:
-            # Simulate the move
-            saved_src = piece
-            saved_dst = self.board[dst_row][dst_col]
-
-            self.board[dst_row][dst_col] = piece
-            self.board[src_row][src_col] = "."
-
-            in_check = self.is_in_check(role)
-
-            # Undo the move
-            self.board[src_row][src_col] = saved_src
-            self.board[dst_row][dst_col] = saved_dst
-
-            if in_check:
+            if self.leaves_king_attacked(src_row * 8 + src_col, dst_row * 8 + dst_col, role):
                 return False
         # --- END KING SAFETY CHECK ---
 
         return True
-    
+
     def is_checkmate(self, role):
         if not self.is_in_check(role):
             return False  # must be in check
+        return not self.has_legal_move(role)  # No escape → checkmate
 
-        # Try every legal move for this side
-        for r in range(8):
-            for c in range(8):
-                piece = self.board[r][c]
-                if piece == ".":
-                    continue
-
-                if role == "white" and not piece.isupper():
-                    continue
-                if role == "black" and not piece.islower():
-                    continue
-
-                # Try all 64 squares as target
-                for rr in range(8):
-                    for cc in range(8):
-                        src = chr(c + ord('a')) + str(8 - r)
-                        dst = chr(cc + ord('a')) + str(8 - rr)
-
-                        # If the move is valid
-                        if self.validate_move(src, dst, role):
-                            # Simulate move
-                            temp = self.board[rr][cc]
-                            self.board[rr][cc] = piece
-                            self.board[r][c] = "."
+    def is_stalemate(self, role):
+        if self.is_in_check(role):
+            return False
+        return not self.has_legal_move(role)
 
-                            still_in_check = self.is_in_check(role)
+    # --- Legal Move Generation ---
 
-                            # revert
-                            self.board[r][c] = piece
-                            self.board[rr][cc] = temp
+    def generate_legal_moves(self, role):
+        """
+        Returns every legal move for role as a list of (src, dst) algebraic pairs.
+        A pawn reaching the last rank is listed once; the promotion piece is chosen in make_move.
+        """
+        return list(self.iter_legal_moves(role))
 
-                            if not still_in_check:
-                                return False  # There is at least one escape move
+    def has_legal_move(self, role):
+        for _ in self.iter_legal_moves(role):
+            return True
+        return False
 
-        return True  # No escape → checkmate
+    def iter_legal_moves(self, role):
+        squares = self.squares
+        own = WHITE_PIECES if role == "white" else BLACK_PIECES
+        king = squares.find(KING_BYTES[role])
+        opponent = "white" if role == "black" else "black"
+        opponent_attacks = self.attack_counts
+        offset = COUNT_OFFSETS[opponent]
+        checkers = self._attackers(king, opponent)
+
+        # Squares a non-king move must land on to deal with a single check:
+        # capture the checker, or block the line between it and the king.
+        evasion_squares = None
+        # Squares behind the king on a checking slider's line; still attacked once the king steps back.
+        xray_squares = set()
+        for checker in checkers:
+            if squares[checker] | 32 in SLIDERS:
+                step_r, step_c = self.line_step(checker, king)
+                row, col = king // 8 + step_r, king % 8 + step_c
+                if 0 <= row < 8 and 0 <= col < 8:
+                    xray_squares.add(row * 8 + col)
+        if len(checkers) == 1:
+            checker = checkers[0]
+            evasion_squares = {checker}
+            if squares[checker] | 32 in SLIDERS:
+                evasion_squares.update(self.squares_between(king, checker))
+
+        pins = self.pinned_pieces(king, role)
+
+        for sq in range(64):
+            piece = squares[sq]
+            if piece not in own:
+                continue
+
+            src = SQUARE_NAMES[sq]
+
+            if piece | 32 == KING:
+                for target in self.piece_targets(sq, piece):
+                    if opponent_attacks[offset + target] == 0 and target not in xray_squares:
+                        yield (src, SQUARE_NAMES[target])
+                continue
+
+            if len(checkers) > 1:
+                continue  # Double check: only the king can move
+
+            pin = pins.get(sq)
+            for target in self.piece_targets(sq, piece):
+                if evasion_squares is not None and target not in evasion_squares:
+                    continue
+                # A pinned piece may only slide along the pin line
+                if pin and target not in pin:
+                    continue
+                yield (src, SQUARE_NAMES[target])
+
+    def pinned_pieces(self, king, role):
+        """Maps each of role's pinned pieces to the squares of its pin line, up to and including the pinner."""
+        squares = self.squares
+        own = WHITE_PIECES if role == "white" else BLACK_PIECES
+        pins = {}
+        for rays, kinds in ((ROOK_RAYS, (ROOK, QUEEN)), (BISHOP_RAYS, (BISHOP, QUEEN))):
+            for ray in rays[king]:
+                shield = None
+                for i, sq in enumerate(ray):
+                    piece = squares[sq]
+                    if piece == EMPTY:
+                        continue
+                    if piece not in own:
+                        if shield is not None and piece | 32 in kinds:
+                            pins[shield] = ray[:i + 1]
+                        break
+                    if shield is not None:
+                        break
+                    shield = sq
+        return pins
+
+    def piece_targets(self, sq, piece):
+        """Squares the piece (a byte) on sq can geometrically move to, ignoring king safety."""
+        squares = self.squares
+        white = piece in WHITE_PIECES
+        enemy = BLACK_PIECES if white else WHITE_PIECES
+        piece_type = piece | 32
+        targets = []
+
+        if piece_type == PAWN:
+            step = -8 if white else 8
+            ahead = sq + step
+            if 0 <= ahead < 64:
+                if squares[ahead] == EMPTY:
+                    targets.append(ahead)
+                    if sq // 8 == (6 if white else 1) and squares[ahead + step] == EMPTY:
+                        targets.append(ahead + step)
+                for target in PAWN_ATTACKS[white][sq]:
+                    if squares[target] in enemy:
+                        targets.append(target)
+            return targets
+
+        if piece_type == KNIGHT or piece_type == KING:
+            for target in (KNIGHT_TARGETS if piece_type == KNIGHT else KING_TARGETS)[sq]:
+                occupant = squares[target]
+                if occupant == EMPTY or occupant in enemy:
+                    targets.append(target)
+            return targets
+
+        for ray in SLIDER_RAYS[piece_type][sq]:
+            for target in ray:
+                occupant = squares[target]
+                if occupant == EMPTY:
+                    targets.append(target)
+                else:
+                    if occupant in enemy:
+                        targets.append(target)
+                    break
+        return targets
+
+    def leaves_king_attacked(self, src, dst, role):
+        self.push_squares(src, dst)
+        in_check = self.is_in_check(role)
+        self.pop()
+        return in_check
+
+    def line_step(self, src, dst):
+        """(dr, dc) of one step from square src towards dst."""
+        dr = dst // 8 - src // 8
+        dc = dst % 8 - src % 8
+        steps = max(abs(dr), abs(dc))
+        step_r = dr // steps if steps != 0 else 0
+        step_c = dc // steps if steps != 0 else 0
+        return step_r, step_c
+
+    def squares_between(self, src, dst):
+        step_r, step_c = self.line_step(src, dst)
+        steps = max(abs(dst // 8 - src // 8), abs(dst % 8 - src % 8))
+        return [src + i * (step_r * 8 + step_c) for i in range(1, steps)]
+
+    def attackers(self, row, col, by_role):
+        """(row, col) of every by_role piece attacking (row, col)."""
+        return [divmod(sq, 8) for sq in self._attackers(row * 8 + col, by_role)]
+
+    def _attackers(self, sq, by_role):
+        """Square indexes of by_role pieces attacking square index sq."""
+        squares = self.squares
+        own = WHITE_PIECES if by_role == "white" else BLACK_PIECES
+        found = []
+        mask = self.attacked_by[sq]
+        while mask:
+            low = mask & -mask
+            attacker = low.bit_length() - 1
+            mask ^= low
+            if squares[attacker] in own:
+                found.append(attacker)
+        return found
+
+    # --- END Legal Move Generation ---
+
+    # --- Make / Unmake ---
+
+    def push(self, move, record=True):
+        """
+        Applies move = (src, dst) or (src, dst, promotion) without validating it.
+        Returns (captured_piece, promoted_char); pop() takes it back. With
+        record=False nothing is kept for pop(), for moves that stay played.
+        """
+        src_row, src_col = algebraic_to_index(move[0])
+        dst_row, dst_col = algebraic_to_index(move[1])
+        promotion_to = move[2] if len(move) > 2 else None
+        return self.push_squares(src_row * 8 + src_col, dst_row * 8 + dst_col, promotion_to, record)
+
+    def push_squares(self, src, dst, promotion_to=None, record=True):
+        piece = self.squares[src]
+        captured = self.squares[dst]
+
+        # A pawn reaching the last rank always promotes, to a queen unless told otherwise
+        promoted = 0
+        if piece | 32 == PAWN and (dst < 8 or dst >= 56):
+            if not (promotion_to and promotion_to.lower() in self.PIECE_NAMES):
+                promotion_to = "q"
+            promoted = ord(promotion_to.upper() if piece in WHITE_PIECES else promotion_to.lower())
+
+        if record:
+            self.move_stack.append((src, dst, piece, captured, promoted))
+        self.set_square(src, EMPTY)
+        self.set_square(dst, promoted or piece)
+        return chr(captured), chr(promoted) if promoted else None
+
+    def pop(self):
+        """Takes back the last pushed move and returns it as (src, dst, promoted_char)."""
+        src, dst, piece, captured, promoted = self.move_stack.pop()
+        self.set_square(dst, captured)
+        self.set_square(src, piece)
+        return (SQUARE_NAMES[src], SQUARE_NAMES[dst], chr(promoted) if promoted else None)
+
+    # --- END Make / Unmake ---
+
+    # --- Incremental King / Attack Tracking ---
+
+    def set_square(self, sq, piece):
+        """Puts piece (a byte, EMPTY for none) on a square and updates the hash and attack maps."""
+        squares = self.squares
+        old = squares[sq]
+        if old == piece:
+            return
+
+        self.zobrist ^= BYTE_KEYS[old][sq] ^ BYTE_KEYS[piece][sq]
+
+        # A slider reaching this square now stops here, or now sees past it up to
+        # the next blocker. A capture leaves every such ray as it was.
+        if (old == EMPTY) != (piece == EMPTY):
+            blocked = old == EMPTY
+            attacked_by = self.attacked_by
+            counts = self.attack_counts
+            mask = attacked_by[sq]
+            while mask:
+                low = mask & -mask
+                attacker = low.bit_length() - 1
+                mask ^= low
+                slider = squares[attacker]
+                if slider | 32 not in SLIDERS:
+                    continue
+                offset = 0 if slider in WHITE_PIECES else 64
+                for target in BEYOND[attacker * 64 + sq]:
+                    if blocked:
+                        attacked_by[target] &= ~low & MASK64
+                        counts[offset + target] -= 1
+                    else:
+                        attacked_by[target] |= low
+                        counts[offset + target] += 1
+                    if squares[target] != EMPTY:
+                        break
+
+        if old != EMPTY:
+            self.remove_attacks(sq)
+        squares[sq] = piece
+        if piece != EMPTY:
+            self.add_attacks(sq)
+
+    def add_attacks(self, sq):
+        piece = self.squares[sq]
+        counts = self.attack_counts
+        offset = 0 if piece in WHITE_PIECES else 64
+        attacked_by = self.attacked_by
+        bit = 1 << sq
+        for target in self.attacked_squares(sq, piece):
+            attacked_by[target] |= bit
+            counts[offset + target] += 1
+
+    def remove_attacks(self, sq):
+        """Call while the piece is still on sq: its attacks are recomputed from the board."""
+        piece = self.squares[sq]
+        targets = self.attacked_squares(sq, piece)
+        counts = self.attack_counts
+        offset = 0 if piece in WHITE_PIECES else 64
+        attacked_by = self.attacked_by
+        keep = ~(1 << sq) & MASK64  # array("Q") only holds unsigned values
+        for target in targets:
+            attacked_by[target] &= keep
+            counts[offset + target] -= 1
+
+    def attacked_squares(self, sq, piece):
+        """Squares the piece attacks: pawn diagonals, and slider rays up to and including the first blocker."""
+        piece_type = piece | 32
+
+        if piece_type == PAWN:
+            return PAWN_ATTACKS[piece in WHITE_PIECES][sq]
+        if piece_type == KNIGHT:
+            return KNIGHT_TARGETS[sq]
+        if piece_type == KING:
+            return KING_TARGETS[sq]
+
+        squares = self.squares
+        targets = []
+        for ray in SLIDER_RAYS[piece_type][sq]:
+            for target in ray:
+                targets.append(target)
+                if squares[target] != EMPTY:
+                    break
+        return tuple(targets)
+
+    # --- END Incremental King / Attack Tracking ---
 
 
     def is_path_clear(self, src_row, src_col, dst_row, dst_col):
@@ -228,44 +575,27 @@ class ChessGame:
         for i in range(1, steps):
             r = src_row + i * step_r
             c = src_col + i * step_c
-            if self.board[r][c] != ".":
+            if self.squares[r * 8 + c] != EMPTY:
                 return False
         return True
-    
-    def find_king(self, role):
-        king_char = "K" if role == "white" else "k"
-        for r in range(8):
-            for c in range(8):
-                if self.board[r][c] == king_char:
-                    return r, c
-        return None
-    
-    def is_square_attacked(self, row, col, by_role):
-        # Try every piece of by_role, see if it can move to king square
-        for r in range(8):
-            for c in range(8):
-                piece = self.board[r][c]
-                if piece == ".":
-                    continue
 
-                if by_role == "white" and not piece.isupper():
-                    continue
-                if by_role == "black" and not piece.islower():
-                    continue
+    # Same (row, col) signatures as BitboardGame; the square index versions stay internal
+
+    def find_king(self, role):
+        king = self.squares.find(KING_BYTES[role])
+        if king < 0:
+            return None
+        return divmod(king, 8)
 
-                src = chr(c + ord('a')) + str(8 - r)
-                dst = chr(col + ord('a')) + str(8 - row)
+    def is_square_attacked(self, row, col, by_role):
+        return self.attack_counts[COUNT_OFFSETS[by_role] + row * 8 + col] > 0
 
-                if self.validate_move(src, dst, by_role, skip_self_check=True):
-                    return True
-        return False
-    
     def is_in_check(self, role):
-        king_row, king_col = self.find_king(role)
         opponent = "white" if role == "black" else "black"
-        return self.is_square_attacked(king_row, king_col, opponent)
+        king = self.squares.find(KING_BYTES[role])
+        return king >= 0 and self.attack_counts[COUNT_OFFSETS[opponent] + king] > 0
 
 
 
     def __str__(self):
-        return self.print_board(self.board)
\ No newline at end of file
+        return "\n".join(" ".join(row) for row in self.get_board())
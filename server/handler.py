@@ -1,191 +1,790 @@
 import json
+import secrets
+import threading
+import time
 from game import ChessGame
+from bitboard import BitboardGame
+from position_cache import analyse_position
+from rooms import Room, RoomRegistry
+from protocol import (PROTOCOLS, SQUARE_INDEXES, FrameDecoder, decode_move_message,
+                      encode_frame, encode_json, encode_result, is_json)
+from workers import ForwardConnection, forward_connection, forward_connection_async
+from log import get_logger
+from metrics import (BYTES_RECEIVED, BYTES_SENT, CONNECTIONS, ENGINE_SECONDS,
+                     IDLE_REAPED, MESSAGE_SECONDS, Gauge)
+from outbox import AsyncOutbox, ThreadOutbox
 
-# Global room tracking
-rooms = {}  # { "RoomName": { "players": [conn1, conn2], "roles": {conn1: "white", conn2: "black"}, "names": {conn1: "name1", conn2: "name2"}, "board": ChessGame() } }
-client_rooms = {}  # { conn: "RoomName" }
+log = get_logger("handler")
+
+# Rules engines a room can be created with. "list" is the reference 8x8 implementation.
+ENGINES = {
+    "list": ChessGame,
+    "bitboard": BitboardGame,
+}
+DEFAULT_ENGINE = "list"
+
+# Global room tracking: rooms by name and each client's room, see rooms.py
+registry = RoomRegistry()
+Gauge("chess_rooms", "Open rooms", lambda: len(registry))
+Gauge("chess_rooms_hibernated", "Open rooms whose board is hibernated",
+      lambda: sum(1 for room in registry.rooms() if room.hibernated is not None))
+client_protocols = {}  # { conn: "json" | "binary" }, negotiated at JOIN
+outboxes = {}  # { conn: outbox }, every frame to a connection goes through its outbox
+
+# Set by main.py in multi-worker mode: JOIN/SPECTATE/RESUME for rooms owned by another worker are forwarded there
+router = None
+
+# Set by main.py: every new room and accepted move is appended here, see journal.py
+journal = None
+# Set by main.py: finished games are kept here, see archive.py
+archive = None
+
+# Set by main.py: rooms untouched for this many seconds are hibernated, see rooms.py
+hibernate_after = None
+# Rooms nobody was in when they hibernated; they live only in their journal until the next JOIN/SPECTATE
+evicted_rooms = {}  # { name: room's last_active }
+evicted_lock = threading.Lock()  # Orders an evicted room's restore against its expiry
+# Set by main.py: an empty room nobody has come back to for this many seconds is deleted with its journal
+unclaimed_ttl = None
+
+# Set by main.py: seconds of silence after which a connection counts as dead and is dropped
+idle_timeout = None
+
+RECV_SIZE = 4096
+MESSAGE_TYPES = ("JOIN", "MOVE", "SPECTATE", "RESUME", "LEAVE", "PING", "PONG")  # Anything else is counted as "other"
+ROOM_MESSAGES = ("JOIN", "SPECTATE", "RESUME")  # Messages that pick a room, and so a worker
+MAX_RESYNCS = 3  # Snapshots a backed-up reader gets without catching up before it is dropped
+RESUME_GRACE = 60  # Seconds a dropped player's seat is held for a RESUME
+HEARTBEAT_INTERVAL = 15  # Seconds of silence before a connection is sent a PING
+PING_FRAME = encode_json({"type": "PING"})
+
+def send_bytes(conn, data):
+    """Queues data for conn's writer. Never blocks on the peer."""
+    outbox = outboxes.get(conn)
+    if outbox is None:
+        conn.sendall(data)
+    elif outbox.closed:
+        return
+    elif not outbox.put(data):
+        # The reader is backed up. What is queued is stale anyway: replace it with
+        # the room's current state, and give up on readers that never catch up.
+        room = registry.room_of(conn)
+        if room is None or outbox.resyncs >= MAX_RESYNCS:
+            log.warning("slow_reader_dropped", addr=outbox.addr)
+            outbox.close(drop=True)
+            return
+        log.info("slow_reader_resync", addr=outbox.addr, room=room.name)
+        data = encode_json(snapshot(room, conn))
+        outbox.replace(data)
+    BYTES_SENT.inc(len(data))
+
+def snapshot(room, conn):
+    """Everything a client needs to redraw the game from scratch."""
+    with room.lock:
+        return {
+            "type": "SNAPSHOT",
+            "room": room.name,
+            "role": room.roles.get(conn),
+            "board": room.board.get_board(),
+            "turn": room.turn,
+            "ply": len(room.moves),
+            "names": room.role_names(),
+            "legal": legal_moves(room),
+            **(room.result or {"game_over": False}),
+        }
+
+def legal_moves(room):
+    """
+    The side to move's legal moves, packed as in position_cache ("e2e4e7e5..."),
+    so clients highlight moves without a rules engine of their own. Caller holds room.lock.
+    """
+    if room.result:
+        return ""
+    return analyse_position(room.board, room.turn).moves
+
+def canonical_square(square):
+    """square as stored and sent ("e2"), or None if it doesn't name a square."""
+    if isinstance(square, str) and square.lower() in SQUARE_INDEXES:
+        return square.lower()
+    return None
+
+def send_message(conn, data):
+    send_bytes(conn, encode_json(data))
+
+def encode_move_result(data, mover_role, protocol):
+    """Frame for a MOVE reply or UPDATE in the given protocol."""
+    if protocol == "binary":
+        try:
+            return encode_result(data, mover_role)
+        except (ValueError, TypeError, IndexError, KeyError):
+            pass  # Squares that don't fit a move code (a malformed MOVE) still go out as JSON
+    return encode_json(data)
+
+def send_move_result(conn, data, mover_role):
+    """Sends a MOVE reply or UPDATE in the connection's negotiated protocol."""
+    send_bytes(conn, encode_move_result(data, mover_role, client_protocols.get(conn)))
+
+def broadcast(room, data, mover_role=None, exclude=None):
+    """
+    Sends data to everyone in the room but exclude. Each protocol's frame is
+    encoded once and the same bytes go to every player and spectator using it.
+    mover_role marks data as a move result (see encode_move_result).
+    """
+    frames = {}
+    for peer in room.players + room.spectators:
+        if peer is exclude:
+            continue
+        protocol = client_protocols.get(peer, "json") if mover_role else "json"
+        frame = frames.get(protocol)
+        if frame is None:
+            if mover_role:
+                frame = frames[protocol] = encode_move_result(data, mover_role, protocol)
+            else:
+                frame = frames[protocol] = encode_json(data)
+        send_bytes(peer, frame)
+
+def make_outbox(conn, addr):
+    if isinstance(conn, AsyncConnection):
+        return AsyncOutbox(conn.writer, addr)
+    return ThreadOutbox(conn, addr)
+
+def new_room(name, engine):
+    # The engine is only chosen by whoever creates the room
+    if engine not in ENGINES:
+        engine = DEFAULT_ENGINE
+    return Room(name, engine, ENGINES[engine]())
+
+def create_room(name, engine):
+    room = restore_room(name)
+    if room is None:
+        room = new_room(name, engine)
+        if journal:
+            journal.create(name, room.engine)
+    return room
+
+def restore_room(name):
+    """Rebuilds an evicted room from its journal, or returns None if it wasn't evicted."""
+    with evicted_lock:
+        if name not in evicted_rooms:
+            return None
+        del evicted_rooms[name]
+    record = journal.load_room(name)
+    if record is None:
+        return None
+    log.info("room_restored", room=name)
+    return replay_room(*record)
+
+def replay_room(name, engine, records):
+    """A room with its journal's moves played on a fresh board and its seats' names."""
+    room = new_room(name, engine)
+    for move in records:
+        if move.get("op") == "seat":
+            room.seats[move["role"]] = move["name"]
+            continue
+        src, dst = canonical_square(move.get("from")), canonical_square(move.get("to"))
+        result = src and dst and room.board.make_move(src, dst, room.turn, move.get("promotion"))[0]
+        if not result:
+            log.warning("journal_bad_move", room=name, ply=len(room.moves), move=move)
+            break
+        room.moves.append((src, dst, move.get("promotion")))
+        room.turn = "black" if room.turn == "white" else "white"
+    status = analyse_position(room.board, room.turn)
+    if status.game_over:
+        room.result = {"game_over": True, "winner": None, "reason": "stalemate", "winner_name": None}
+        if status.checkmate:
+            winner = "black" if room.turn == "white" else "white"
+            room.result.update(reason="checkmate", winner=winner, winner_name=room.seats.get(winner))
+    return room
+
+def recover_rooms():
+    """
+    Rebuilds the rooms in the journal after a restart by replaying their moves.
+    With --workers, each worker only takes the rooms it owns.
+    """
+    if journal is None:
+        return 0
+    recovered = 0
+    for name, engine, records in journal.load():
+        if router and router.owner(name) != router.index:
+            continue
+        room = replay_room(name, engine, records)
+        registry.get_or_create(name, lambda: room)
+        recovered += 1
+    log.info("rooms_recovered", rooms=recovered)
+    return recovered
+
+def hibernate_idle_rooms():
+    """
+    Timer job: hibernates every room untouched for hibernate_after seconds. A room
+    nobody is in is dropped altogether if its journal can bring it back.
+    """
+    idle_since = time.monotonic() - hibernate_after
+    hibernated = evicted = 0
+    for room in registry.rooms():
+        if room.last_active > idle_since or not room.lock.acquire(blocking=False):
+            continue  # Busy rooms are left for the next sweep
+        # One room that can't be hibernated or evicted must not stop the sweep for the rest
+        try:
+            if room.closed:
+                continue
+            if journal and not room.players and not room.spectators and not room.away:
+                try:
+                    # Listed first, so a JOIN that misses the registry finds it here
+                    with evicted_lock:
+                        evicted_rooms[room.name] = room.last_active
+                    registry.remove_if_empty(room)
+                    evicted += 1
+                except Exception as e:
+                    log.error("evict_failed", room=room.name, error=e)
+            elif room.hibernated is None:
+                try:
+                    room.hibernate()
+                    hibernated += 1
+                except Exception as e:
+                    log.error("hibernate_failed", room=room.name, error=e)
+        finally:
+            room.lock.release()
+    if hibernated or evicted:
+        log.info("rooms_hibernated", hibernated=hibernated, evicted=evicted)
+
+def expire_unclaimed_rooms():
+    """
+    Timer job: deletes rooms nobody has joined for unclaimed_ttl seconds, with
+    their journals, so a game abandoned before a restart isn't replayed forever.
+    Covers both evicted rooms and empty ones still in the registry after recovery.
+    """
+    cutoff = time.monotonic() - unclaimed_ttl
+    expired = 0
+    with evicted_lock:
+        for name, last_active in list(evicted_rooms.items()):
+            if last_active <= cutoff:
+                del evicted_rooms[name]
+                # Queued under the lock, so a JOIN that recreates the room queues its create after this
+                journal.delete(name)
+                expired += 1
+    for room in registry.rooms():
+        if room.last_active > cutoff or not room.lock.acquire(blocking=False):
+            continue
+        try:
+            if registry.remove_if_empty(room):
+                journal.delete(room.name)
+                expired += 1
+        finally:
+            room.lock.release()
+    if expired:
+        log.info("rooms_expired", rooms=expired)
+
+def expire_seats():
+    """Timer job: gives up seats whose player hasn't resumed within RESUME_GRACE."""
+    now = time.monotonic()
+    for room in registry.rooms():
+        if not room.away:
+            continue
+        with room.lock:
+            for role, (name, deadline) in list(room.away.items()):
+                if deadline <= now:
+                    del room.away[role]
+                    room.tokens.pop(role, None)
+                    log.info("seat_expired", room=room.name, role=role, name=name)
+            close_if_empty(room)
+
+def reap_idle_connections():
+    """
+    Timer job: PINGs connections that have gone quiet and drops the ones silent
+    for longer than idle_timeout (crashed clients, half-open TCP), which frees
+    their thread and holds their seat for RESUME. Must run where the connections
+    live: main.py hands it to the event loop in asyncio mode.
+    """
+    now = time.monotonic()
+    for conn, outbox in list(outboxes.items()):
+        if outbox.closed or outbox.last_seen is None:
+            continue
+        idle = now - outbox.last_seen
+        if idle > idle_timeout:
+            log.info("idle_reaped", addr=outbox.addr, idle=round(idle, 1))
+            IDLE_REAPED.inc()
+            outbox.close(drop=True)  # The connection's reader wakes up and cleans up
+        elif idle > HEARTBEAT_INTERVAL:
+            send_bytes(conn, PING_FRAME)
+
+def close_if_empty(room):
+    """Caller holds room.lock."""
+    if registry.remove_if_empty(room):
+        log.info("room_closed", room=room.name)
+        if journal:
+            journal.delete(room.name)
+
+def handle_message(conn, addr, data_dict):
+    """
+    Handles one decoded client message. conn only needs sendall() and close(),
+    so thread and asyncio connections share this.
+    Returns False when the connection should be closed.
+    """
+    msg_type = data_dict.get("type")
+
+    if msg_type == "JOIN":
+        name = str(data_dict.get("name") or "Player")  # Stored, journalled and archived as text
+        room_name = data_dict.get("room")
+        engine = data_dict.get("engine", DEFAULT_ENGINE)
+
+        if registry.room_of(conn) is not None:
+            send_message(conn, {
+                "status": "fail",
+                "message": "Already in a room."
+            })
+            return True
+
+        if not isinstance(room_name, str) or not room_name:
+            send_message(conn, {
+                "status": "fail",
+                "message": "A room name is required."
+            })
+            return True
+
+        # The seat check and the seat assignment happen under the room's lock,
+        # so two JOINs racing for the last seat can't both get it.
+        with registry.locked(room_name, lambda: create_room(room_name, engine)) as room:
+            if len(room.players) + len(room.away) >= 2:
+                send_message(conn, {
+                    "status": "fail",
+                    "message": "Room is full. Only 2 players allowed."
+                })
+                return False
+
+            # Assign role
+            # role = "white" if len(room.players) == 0 else "black"
+
+            ## Role has to take account of who quit, white or black.
+            ## In the old, above case, player who quit is forced into black, even if they were white.
+            current_role = set(room.roles.values()) | set(room.away)  # Held seats count as taken
+            free = [seat for seat in ("white", "black") if seat not in current_role]
+            ## A player coming back by name (e.g. after a restart lost their resume token)
+            ## gets their own colour back; anyone else gets the first free seat.
+            returning = [seat for seat in free if room.seats.get(seat) == name]
+            role = (returning or free)[0]
+
+            room.players.append(conn)
+            room.roles[conn] = role
+            room.names[conn] = name
+            if room.seats.get(role) != name:
+                room.seats[role] = name
+                if journal:
+                    journal.seat(room_name, role, name)
+            room.tokens[role] = secrets.token_urlsafe(16)
+            registry.bind(conn, room)
+
+            protocol = data_dict.get("protocol", "json")
+            client_protocols[conn] = protocol if protocol in PROTOCOLS else "json"
+
+            log.info("join", name=name, room=room_name, role=role, addr=addr)
+            send_message(conn, {
+                "status": "joined",
+                "room": room_name,
+                "role": role,
+                "token": room.tokens[role], # Sent back in RESUME to get this seat back after a drop
+                "board": room.board.get_board(),
+                "turn": room.turn,
+                "ply": len(room.moves),
+                "engine": room.engine,
+                "protocol": client_protocols[conn],
+                "names": room.role_names(),
+                "legal": legal_moves(room),
+                "message": f"Welcome {name}, you are playing as {role}."
+            })
+
+            # Binary clients resolve names from this table instead of per-move fields
+            broadcast(room, {"type": "NAMES", "names": room.role_names()}, exclude=conn)
+
+    elif msg_type == "SPECTATE":
+        room_name = data_dict.get("room")
+
+        if registry.room_of(conn) is not None:
+            send_message(conn, {
+                "status": "fail",
+                "message": "Already in a room."
+            })
+            return True
+
+        with registry.locked(room_name, (lambda: restore_room(room_name)) if room_name in evicted_rooms else None) as room:
+            if room is None:
+                send_message(conn, {
+                    "status": "fail",
+                    "message": f"No game in room '{room_name}' to watch."
+                })
+                return False
+
+            protocol = data_dict.get("protocol", "json")
+            client_protocols[conn] = protocol if protocol in PROTOCOLS else "json"
+            room.spectators.append(conn)
+            registry.bind(conn, room)
+
+            log.info("spectate", name=data_dict.get("name"), room=room_name, addr=addr)
+            send_message(conn, {
+                "status": "spectating",
+                "room": room_name,
+                "board": room.board.get_board(),
+                "turn": room.turn,
+                "engine": room.engine,
+                "protocol": client_protocols[conn],
+                "names": room.role_names(),
+                **(room.result or {"game_over": False}), # A finished game sends no more UPDATEs
+                "message": f"Watching room '{room_name}'."
+            })
+
+    elif msg_type == "RESUME":
+        room_name = data_dict.get("room")
+        token = data_dict.get("token")
+
+        if registry.room_of(conn) is not None:
+            send_message(conn, {
+                "status": "fail",
+                "message": "Already in a room."
+            })
+            return True
+
+        with registry.locked(room_name) as room:
+            role = None
+            if room is not None and isinstance(token, str):
+                for seat, seat_token in room.tokens.items():
+                    if secrets.compare_digest(seat_token, token):
+                        role = seat
+            if role is None:
+                # Expired, or the server restarted: the client should JOIN again
+                send_message(conn, {
+                    "status": "fail",
+                    "resume": "failed",
+                    "message": "Could not resume the game."
+                })
+                return True
+
+            name = room.away.pop(role, (None, None))[0]
+            # The old connection may not have noticed it is dead yet
+            for peer in list(room.players):
+                if room.roles.get(peer) == role:
+                    name = room.names.pop(peer, name)
+                    room.players.remove(peer)
+                    room.roles.pop(peer, None)
+                    registry.unbind(peer)
+                    outbox = outboxes.get(peer)
+                    if outbox:
+                        outbox.close(drop=True)
+
+            room.players.append(conn)
+            room.roles[conn] = role
+            room.names[conn] = name
+            registry.bind(conn, room)
+
+            protocol = data_dict.get("protocol", "json")
+            client_protocols[conn] = protocol if protocol in PROTOCOLS else "json"
+
+            # Only what the client missed, unless it can't tell us where it was
+            ply = data_dict.get("ply")
+            reply = {
+                "status": "resumed",
+                "room": room_name,
+                "role": role,
+                "turn": room.turn,
+                "ply": len(room.moves),
+                "engine": room.engine,
+                "protocol": client_protocols[conn],
+                "names": room.role_names(),
+                "legal": legal_moves(room),
+                **(room.result or {"game_over": False}),
+            }
+            if isinstance(ply, int) and 0 <= ply <= len(room.moves):
+                reply["moves"] = [list(move) for move in room.moves[ply:]]
+            else:
+                reply["board"] = room.board.get_board()
+
+            log.info("resume", name=name, room=room_name, role=role, missed=len(reply.get("moves", ())), addr=addr)
+            send_message(conn, reply)
+            broadcast(room, {"type": "NAMES", "names": room.role_names()}, exclude=conn)
+
+    elif msg_type == "PING":
+        send_message(conn, {"type": "PONG"})
+
+    elif msg_type == "PONG":
+        pass  # Proof of life only: receiving it already reset the idle clock
+
+    elif msg_type == "LEAVE":
+        # A deliberate quit: the seat is freed at once instead of held for RESUME.
+        # The client closes the connection itself right after.
+        leave_room(conn, addr, hold_seat=False)
+
+    elif msg_type == "MOVE":
+        room = registry.room_of(conn)
+        if not room: 
+            return True # Safety check
+
+        # Held through validation, the move and the broadcast, so a MOVE never
+        # interleaves with another MOVE or a leave in the same room
+        with room.lock:
+            if room.closed:
+                return True
+
+            if conn in room.spectators:
+                send_message(conn, {
+                    "status": "fail",
+                    "message": "Spectators cannot move."
+                })
+                return True
+
+            role = room.roles.get(conn)
+            board = room.board
+
+            if room.turn != role:
+                send_message(conn, {
+                    "status": "fail",
+                    "message": f"Not your turn. It's {room.turn}'s turn."
+                })
+                return True
+            
+            # --- NEW: Get mover and opponent names ---
+            mover_name = room.names.get(conn, "Player")
+            opponent_name = "Opponent"
+            for peer in room.players:
+                if peer != conn:
+                    opponent_name = room.names.get(peer, "Opponent")
+            # --- END NEW ---
+            
+            # Only the canonical "e2" form is ever recorded, journalled or archived
+            from_pos = canonical_square(data_dict.get("selected_pos"))
+            to_pos = canonical_square(data_dict.get("target_pos"))
+            if from_pos is None or to_pos is None:
+                send_message(conn, {
+                    "status": "fail",
+                    "message": "Invalid Move"
+                })
+                return True
+            
+            if not board.is_piece_owned_by(from_pos, role):
+                send_message(conn, {
+                    "status": "fail",
+                    "message": f"You cannot move opponent's piece at {from_pos}."
+                })
+                return True
+            
+            # --- MODIFIED: Handle promotion ---
+            promotion_to = data_dict.get("promotion_to")
+            
+            with ENGINE_SECONDS.time("make_move"):
+                result, captured_piece, promoted_to_char = board.make_move(from_pos, to_pos, role, promotion_to)
+            
+            game_over = False
+            winner = None
+            winner_name = None # <-- NEW
+            reason = None
+            legal = None # The opponent's legal moves, sent along with a successful move
+
+            if result:
+                room.turn = "black" if role == "white" else "white"
+                room.moves.append((from_pos, to_pos, promoted_to_char))
+                if journal:
+                    journal.move(room.name, from_pos, to_pos, promoted_to_char)
+
+                opponent_role = room.turn
+
+                # --- Checkmate / Stalemate ---
+                # Shared across rooms: a position seen before is not analysed again.
+                with ENGINE_SECONDS.time("analyse_position"):
+                    status = analyse_position(board, opponent_role)
+                legal = status.moves
+                if status.game_over:
+                    game_over = True
+                    if status.checkmate:
+                        reason = "checkmate"
+                        winner = role
+                        winner_name = mover_name
+                        log.info("game_over", room=room.name, reason=reason, winner=winner, winner_name=winner_name)
+                    else:
+                        reason = "stalemate"
+                        log.info("game_over", room=room.name, reason=reason)
+                    room.result = {"game_over": True, "winner": winner, "reason": reason,
+                                   "winner_name": winner_name}
+                    if archive:
+                        archive.append(room)
+                # if captured_piece and captured_piece.lower() == 'k':
+                #     game_over = True
+                #     winner = role
+                #     winner_name = mover_name # <-- NEW: The mover is the winner
+                #     print(f"[GAME OVER] {winner_name} wins in room {room}!")
+
+            reply = {
+                "status": "success" if result else "fail",
+                "message": "Move Made." if result else "Invalid Move",
+                "from": from_pos,
+                "to": to_pos,
+                "captured": captured_piece if result else None,
+                "game_over": game_over,
+                "winner": winner, # 'white' or 'black', None on stalemate
+                "reason": reason, # 'checkmate' or 'stalemate' when game_over
+                "promoted_to": promoted_to_char,
+                "mover_name": mover_name, # <-- NEW
+                "opponent_name": opponent_name, # <-- NEW
+                "winner_name": winner_name # <-- NEW
+            }
+            if result:
+                reply["legal"] = legal
+            # --- END MODIFICATION ---
+
+            send_move_result(conn, reply, role)
+
+            # Broadcast to opponent and spectators
+            update = {
+                "type": "UPDATE",
+                "from": from_pos,
+                "to": to_pos,
+                "status": reply["status"],
+                "captured": captured_piece if result else None,
+                "game_over": game_over,
+                "winner": winner,
+                "reason": reason,
+                "promoted_to": promoted_to_char,
+                "mover_name": mover_name, # <-- NEW
+                "opponent_name": opponent_name, # <-- NEW
+                "winner_name": winner_name # <-- NEW
+            }
+            if result:
+                update["legal"] = legal
+            broadcast(room, update, role, exclude=conn)
+
+    else:
+        send_message(conn, {
+            "status": "fail",
+            "message": "Unknown message type."
+        })
+
+    return True
+
+
+def leave_room(conn, addr, hold_seat):
+    """
+    Takes conn out of its room. With hold_seat, a player's seat in an unfinished
+    game is kept for RESUME_GRACE seconds so a dropped connection can RESUME it.
+    """
+    room = registry.unbind(conn)
+    if room:
+        with room.lock:
+            if conn in room.players:
+                room.players.remove(conn)
+                role = room.roles.pop(conn, None)
+                name = room.names.pop(conn, None)
+                if hold_seat and role in room.tokens and room.result is None:
+                    room.away[role] = (name, time.monotonic() + RESUME_GRACE)
+                    log.info("away", room=room.name, role=role, addr=addr)
+                else:
+                    room.tokens.pop(role, None)
+                    log.info("leave", room=room.name, addr=addr)
+            elif conn in room.spectators:
+                room.spectators.remove(conn)
+            close_if_empty(room)
+
+def cleanup_client(conn, addr):
+    # Clean up
+    leave_room(conn, addr, hold_seat=True)
+    client_protocols.pop(conn, None)
+    outbox = outboxes.pop(conn, None)
+    if outbox:
+        outbox.close() # Closes conn after the last queued frame, e.g. a "Room is full" reply
+    else:
+        conn.close()
+
+def handle_frames(conn, addr, frames):
+    for i, payload in enumerate(frames):
+        if is_json(payload):
+            data_dict = json.loads(payload)
+        else:
+            data_dict = decode_move_message(payload)
+        log.debug("recv", addr=addr, message=data_dict)
+        if router and data_dict.get("type") in ROOM_MESSAGES and registry.room_of(conn) is None:
+            port = router.forward_port(data_dict.get("room"))
+            if port:
+                log.info("route", addr=addr, port=port)
+                raise ForwardConnection(port, b"".join(encode_frame(frame) for frame in frames[i:]))
+        msg_type = data_dict.get("type")
+        with MESSAGE_SECONDS.time(msg_type if msg_type in MESSAGE_TYPES else "other"):
+            keep_open = handle_message(conn, addr, data_dict)
+        if not keep_open:
+            return False
+    return True
 
 def handle_client(conn, addr):
-    print(f"[NEW CONNECTION] {addr}")
+    log.info("connect", addr=addr)
+    CONNECTIONS.inc()
+    outbox = outboxes[conn] = make_outbox(conn, addr)
+    decoder = FrameDecoder()
     try:
         while True:
-            data = conn.recv(1024)
+            data = conn.recv(RECV_SIZE)
             if not data:
-                print(f"[{addr}] No data received (client closed)")
+                log.info("disconnect", addr=addr)
                 break
+            BYTES_RECEIVED.inc(len(data))
+            outbox.last_seen = time.monotonic()
 
-            print(f"[FROM {addr}] {data.decode()}")
-            data_dict = json.loads(data.decode())
-            msg_type = data_dict.get("type")
-
-            if msg_type == "JOIN":
-                name = data_dict.get("name")
-                room = data_dict.get("room")
-
-                if room not in rooms:
-                    rooms[room] = {
-                        "players": [],
-                        "roles": {},
-                        "names": {}, # <-- NEW: Add names dictionary
-                        "board": ChessGame(),
-                        "turn": "white"
-                    }
-                # else:
-                #     board = rooms[room]["board"]
-
-                if len(rooms[room]["players"]) >= 2:
-                    conn.sendall(json.dumps({
-                        "status": "fail",
-                        "message": "Room is full. Only 2 players allowed."
-                    }).encode("utf-8"))
-                    return
-
-                # Assign role
-                # role = "white" if len(rooms[room]["players"]) == 0 else "black"
-
-                ## Role has to take account of who quit, white or black.
-                ## In the old, above case, player who quit is forced into black, even if they were white.
-                current_role = set(rooms[room]["roles"].values())
-                if current_role == {"black"}:
-                    role = "white"
-                elif current_role == {"white"}:
-                    role = "black"
-                else:
-                    role = "white"
-
-                rooms[room]["players"].append(conn)
-                rooms[room]["roles"][conn] = role
-                rooms[room]["names"][conn] = name 
-                client_rooms[conn] = room
-
-                # print(rooms[room]["board"])
-
-                print(f"[JOIN] {name} joined room '{room}' as {role}")
-                conn.sendall(json.dumps({
-                    "status": "joined",
-                    "room": room,
-                    "role": role,
-                    "board": rooms[room]["board"].get_board(),
-                    "turn": rooms[room]["turn"],
-                    "message": f"Welcome {name}, you are playing as {role}."
-                }).encode("utf-8"))
-                
-            elif msg_type == "MOVE":
-                room = client_rooms.get(conn)
-                if not room: 
-                    continue # Safety check
-
-                role = rooms[room]["roles"].get(conn)
-                board = rooms[room]["board"]
-
-                # Track turn (add this to room dict if not already)
-                if "turn" not in rooms[room]:
-                    rooms[room]["turn"] = "white"
-
-                if rooms[room]["turn"] != role:
-                    conn.sendall(json.dumps({
-                        "status": "fail",
-                        "message": f"Not your turn. It's {rooms[room]['turn']}'s turn."
-                    }).encode("utf-8"))
-                    continue
-                
-                # --- NEW: Get mover and opponent names ---
-                mover_name = rooms[room]["names"].get(conn, "Player")
-                opponent_name = "Opponent"
-                for peer in rooms[room]["players"]:
-                    if peer != conn:
-                        opponent_name = rooms[room]["names"].get(peer, "Opponent")
-                # --- END NEW ---
-                
-                from_pos = data_dict.get("selected_pos")
-                to_pos = data_dict.get("target_pos")
-                
-                if not board.is_piece_owned_by(from_pos, role):
-                    conn.sendall(json.dumps({
-                        "status": "fail",
-                        "message": f"You cannot move opponent's piece at {from_pos}."
-                    }).encode("utf-8"))
-                    continue
-                
-                # --- MODIFIED: Handle promotion ---
-                promotion_to = data_dict.get("promotion_to")
-                
-                result, captured_piece, promoted_to_char = board.make_move(from_pos, to_pos, role, promotion_to)
-                
-                game_over = False
-                winner = None
-                winner_name = None # <-- NEW
+            # One recv may hold several messages, or only part of one
+            if not handle_frames(conn, addr, decoder.feed(data)):
+                break
 
-                if result:
-                    rooms[room]["turn"] = "black" if role == "white" else "white"
+    except ForwardConnection as forward:
+        outbox.last_seen = None  # Not reaped here: the worker that owns the room watches it now
+        try:
+            forward_connection(conn, forward.port, forward.data + bytes(decoder.buffer))
+        except OSError as e:
+            log.error("forward_failed", addr=addr, error=e)
+    except Exception as e:
+        log.error("connection_error", addr=addr, error=e)
+    finally:
+        CONNECTIONS.dec()
+        cleanup_client(conn, addr)
 
-                    opponent_role = rooms[room]["turn"]
 
-                    # --- Checkmate ---
-                    if board.is_checkmate(opponent_role):
-                        game_over = True
-                        winner = role
-                        winner_name = mover_name
-                        print(f"[GAME OVER] Checkmate! {winner_name} ({winner}) wins in room {room}!")
-                    # if captured_piece and captured_piece.lower() == 'k':
-                    #     game_over = True
-                    #     winner = role
-                    #     winner_name = mover_name # <-- NEW: The mover is the winner
-                    #     print(f"[GAME OVER] {winner_name} wins in room {room}!")
-
-                reply = {
-                    "status": "success" if result else "fail",
-                    "message": "Move Made." if result else "Invalid Move",
-                    "from": from_pos,
-                    "to": to_pos,
-                    "captured": captured_piece if result else None,
-                    "game_over": game_over,
-                    "winner": winner, # 'white' or 'black'
-                    "promoted_to": promoted_to_char,
-                    "mover_name": mover_name, # <-- NEW
-                    "opponent_name": opponent_name, # <-- NEW
-                    "winner_name": winner_name # <-- NEW
-                }
-                # --- END MODIFICATION ---
-
-                conn.sendall(json.dumps(reply).encode("utf-8"))
-
-                # Broadcast to opponent
-                for peer in rooms[room]["players"]:
-                    if peer != conn:
-                        peer.sendall(json.dumps({
-                            "type": "UPDATE",
-                            "from": from_pos,
-                            "to": to_pos,
-                            "status": reply["status"],
-                            "captured": captured_piece if result else None,
-                            "game_over": game_over,
-                            "winner": winner,
-                            "promoted_to": promoted_to_char,
-                            "mover_name": mover_name, # <-- NEW
-                            "opponent_name": opponent_name, # <-- NEW
-                            "winner_name": winner_name # <-- NEW
-                        }).encode("utf-8"))
+# --- asyncio mode ---
 
-            else:
-                conn.sendall(json.dumps({
-                    "status": "fail",
-                    "message": "Unknown message type."
-                }).encode("utf-8"))
+class AsyncConnection:
+    """Gives an asyncio stream the sendall()/close() interface handle_message expects."""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    def sendall(self, data):
+        # Buffered by the transport; the connection's own coroutine drains it
+        self.writer.write(data)
+
+    def close(self):
+        self.writer.close()
+
+
+async def handle_client_async(reader, writer):
+    addr = writer.get_extra_info("peername")
+    conn = AsyncConnection(reader, writer)
+    log.info("connect", addr=addr)
+    CONNECTIONS.inc()
+    outbox = outboxes[conn] = make_outbox(conn, addr)
+    decoder = FrameDecoder()
+    try:
+        while True:
+            data = await reader.read(RECV_SIZE)
+            if not data:
+                log.info("disconnect", addr=addr)
+                break
+            BYTES_RECEIVED.inc(len(data))
+            outbox.last_seen = time.monotonic()
+
+            # Replies are written by the connection's outbox task
+            if not handle_frames(conn, addr, decoder.feed(data)):
+                break
 
+    except ForwardConnection as forward:
+        outbox.last_seen = None  # Not reaped here: the worker that owns the room watches it now
+        try:
+            await forward_connection_async(reader, writer, forward.port,
+                                           forward.data + bytes(decoder.buffer))
+        except OSError as e:
+            log.error("forward_failed", addr=addr, error=e)
     except Exception as e:
-        print(f"[ERROR] {addr}: {e}")
+        log.error("connection_error", addr=addr, error=e)
     finally:
-        # Clean up
-        room = client_rooms.get(conn)
-        if room and conn in rooms.get(room, {}).get("players", []):
-            rooms[room]["players"].remove(conn)
-            if conn in rooms[room]["roles"]:
-                del rooms[room]["roles"][conn]
-            print(f"[DISCONNECTED] {addr} left room '{room}'")
-            if not rooms[room]["players"]:
-                print(f"[CLEANUP] Deleting empty room '{room}'")
-                del rooms[room]
-        if conn in client_rooms:
-            del client_rooms[conn]
-        conn.close()
\ No newline at end of file
+        CONNECTIONS.dec()
+        cleanup_client(conn, addr)
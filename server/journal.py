@@ -0,0 +1,182 @@
+## Move journal
+##
+## Each room's history is appended to journal/<digest of room name>.log as JSON
+## lines: a "create" record with the room name and engine, then one "move"
+## record per accepted move and a "seat" record whenever a new name takes a seat.
+## When the server starts, every journal is replayed to rebuild its room, and a
+## player who JOINs it again by name gets their own colour back.
+## A room's journal is deleted when the room closes. A room evicted while idle
+## (handler.hibernate_idle_rooms) is read back from it on the next JOIN; one
+## nobody comes back to is deleted after --unclaimed-ttl (handler.expire_unclaimed_rooms).
+##
+## Appending only puts the record on a queue. One writer thread collects whatever
+## arrives within COMMIT_INTERVAL, writes it and fsyncs each touched file once
+## (group commit), so a burst of moves across many rooms costs one fsync per file
+## per batch, and the MOVE path never waits on the disk. A crash loses at most
+## the last COMMIT_INTERVAL of moves. A file that can't be written only loses
+## its own room's records; the rest of the batch is still committed.
+
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+from log import get_logger
+
+log = get_logger("journal")
+
+COMMIT_INTERVAL = 0.01  # Seconds a batch stays open after its first record
+MAX_OPEN_FILES = 256  # Journals kept open between batches
+
+
+def journal_name(room):
+    # Fixed length whatever the room name (which comes from clients) is; the name itself is in the create record
+    return hashlib.blake2b(str(room).encode("utf-8"), digest_size=16).hexdigest() + ".log"
+
+
+class Journal:
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.queue = queue.Queue()
+        self.files = OrderedDict()  # { path: open file }, least recently used first
+        threading.Thread(target=self.run, name="journal", daemon=True).start()
+
+    def path(self, room):
+        return os.path.join(self.directory, journal_name(room))
+
+    # --- Called from connection threads ---
+
+    def create(self, room, engine):
+        self.queue.put((room, {"op": "create", "room": room, "engine": engine}))
+
+    def move(self, room, src, dst, promotion=None):
+        self.queue.put((room, {"op": "move", "from": src, "to": dst, "promotion": promotion}))
+
+    def seat(self, room, role, name):
+        self.queue.put((room, {"op": "seat", "role": role, "name": name}))
+
+    def delete(self, room):
+        self.queue.put((room, None))
+
+    def flush(self):
+        """Blocks until everything queued so far is on disk."""
+        done = threading.Event()
+        self.queue.put((None, done))
+        done.wait()
+
+    # --- Writer thread ---
+
+    def run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + COMMIT_INTERVAL
+            while True:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            self.commit(batch)
+
+    def commit(self, batch):
+        touched = {}
+        waiters = []
+        try:
+            for room, record in batch:
+                if isinstance(record, threading.Event):
+                    waiters.append(record)
+                    continue
+                path = self.path(room)
+                try:
+                    if record is None:
+                        touched.pop(path, None)
+                        self.close_file(path)
+                        if os.path.exists(path):
+                            os.remove(path)
+                    else:
+                        handle = self.open_file(path)
+                        handle.write(json.dumps(record) + "\n")
+                        touched[path] = handle
+                except (OSError, ValueError) as e:
+                    log.error("journal_write_failed", room=room, error=e)
+                    touched.pop(path, None)
+                    self.close_file(path)
+            for path, handle in touched.items():
+                try:
+                    handle.flush()
+                    os.fsync(handle.fileno())
+                except OSError as e:
+                    log.error("journal_write_failed", file=os.path.basename(path), error=e)
+                    self.close_file(path)
+        finally:
+            # Whatever failed, nobody waits forever on this batch
+            for done in waiters:
+                done.set()
+
+    def open_file(self, path):
+        handle = self.files.get(path)
+        if handle is None:
+            handle = self.files[path] = open(path, "a", encoding="utf-8")
+            if len(self.files) > MAX_OPEN_FILES:
+                _, oldest = self.files.popitem(last=False)
+                oldest.close()  # Its records were fsynced by the batch that wrote them
+        else:
+            self.files.move_to_end(path)
+        return handle
+
+    def close_file(self, path):
+        handle = self.files.pop(path, None)
+        if handle:
+            try:
+                handle.close()
+            except OSError:
+                pass  # Already reported by the write that failed
+
+    # --- Recovery ---
+
+    def load(self):
+        """Yields (room, engine, [move and seat records]) for every journal on disk."""
+        for filename in sorted(os.listdir(self.directory)):
+            if filename.endswith(".log"):
+                try:
+                    record = self.read(os.path.join(self.directory, filename))
+                except OSError as e:
+                    log.warning("journal_unreadable", file=filename, error=e)
+                    continue
+                if record:
+                    yield record
+
+    def load_room(self, room):
+        """(room, engine, [move and seat records]) from room's journal, or None if it has none."""
+        path = self.path(room)
+        return self.read(path) if os.path.exists(path) else None
+
+    def read(self, path):
+        filename = os.path.basename(path)
+        records = []
+        good = 0  # Bytes up to the end of the last complete record
+        with open(path, "rb") as handle:
+            for line in handle:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("unterminated")
+                    records.append(json.loads(line))
+                except ValueError:
+                    break  # A torn last line from a crash mid-write
+                good += len(line)
+        if good < os.path.getsize(path):
+            # Cut it off so the next append starts on a fresh line
+            log.warning("journal_truncated", file=filename, bytes=os.path.getsize(path) - good)
+            with open(path, "r+b") as handle:
+                handle.truncate(good)
+        if not records or records[0].get("op") != "create":
+            log.warning("journal_skipped", file=filename)
+            return None
+        return records[0]["room"], records[0]["engine"], records[1:]
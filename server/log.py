@@ -0,0 +1,175 @@
+## Structured logging
+##
+## Server code logs events through get_logger(subsystem) instead of print():
+##
+##     log = get_logger("handler")
+##     log.info("join", name=name, room=room, role=role)
+##
+## A call only checks the level and puts a tuple on a queue; a background thread
+## formats whatever has queued up and writes it in one batch, so connection
+## threads never wait on the console. If the queue is full the record is dropped
+## and counted rather than blocking the caller.
+##
+## Levels are set per subsystem, e.g. main.py --log-level info,engine=debug
+
+import atexit
+import json
+import os
+import queue
+import sys
+import threading
+import time
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+LEVEL_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARNING: "WARNING", ERROR: "ERROR"}
+LEVELS = {name.lower(): level for level, name in LEVEL_NAMES.items()}
+
+QUEUE_SIZE = 10000
+BATCH_SIZE = 256  # Most records written per write()/flush()
+
+default_level = INFO
+subsystem_levels = {}  # { "engine": DEBUG, ... } overrides default_level
+output_format = "text"  # "text" or "json"
+stream = sys.stderr
+
+_queue = queue.Queue(QUEUE_SIZE)
+_writer_pid = None  # Process that owns the running writer thread; forked workers start their own
+_writer_lock = threading.Lock()
+_dropped = 0
+
+
+class Logger:
+
+    def __init__(self, subsystem):
+        self.subsystem = subsystem
+
+    def enabled(self, level):
+        return level >= subsystem_levels.get(self.subsystem, default_level)
+
+    def log(self, level, event, **fields):
+        if level < subsystem_levels.get(self.subsystem, default_level):
+            return
+        if _writer_pid != os.getpid():
+            _start_writer()
+        try:
+            _queue.put_nowait((time.time(), level, self.subsystem, event, fields))
+        except queue.Full:
+            global _dropped
+            _dropped += 1
+
+    def debug(self, event, **fields):
+        self.log(DEBUG, event, **fields)
+
+    def info(self, event, **fields):
+        self.log(INFO, event, **fields)
+
+    def warning(self, event, **fields):
+        self.log(WARNING, event, **fields)
+
+    def error(self, event, **fields):
+        self.log(ERROR, event, **fields)
+
+
+_loggers = {}
+
+def get_logger(subsystem):
+    logger = _loggers.get(subsystem)
+    if logger is None:
+        logger = _loggers.setdefault(subsystem, Logger(subsystem))
+    return logger
+
+
+def configure(spec=None, fmt=None):
+    """
+    spec is a comma-separated list of LEVEL (the default) and subsystem=LEVEL
+    entries, e.g. "warning,handler=info". Raises ValueError on an unknown level.
+    """
+    global default_level, output_format
+    for part in (spec or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        subsystem, _, level = part.rpartition("=")
+        if level.lower() not in LEVELS:
+            raise ValueError(f"Unknown log level {level!r}")
+        if subsystem:
+            subsystem_levels[subsystem] = LEVELS[level.lower()]
+        else:
+            default_level = LEVELS[level.lower()]
+    if fmt:
+        output_format = fmt
+
+
+def format_value(value):
+    if isinstance(value, tuple) and len(value) == 2:
+        text = f"{value[0]}:{value[1]}"  # (host, port) address
+    else:
+        text = value if isinstance(value, str) else repr(value)
+    if not text or any(char in text for char in ' "='):
+        return json.dumps(text)
+    return text
+
+
+def format_record(record):
+    created, level, subsystem, event, fields = record
+    if output_format == "json":
+        return json.dumps({"time": created, "level": LEVEL_NAMES[level], "subsystem": subsystem,
+                           "event": event, **fields}, default=repr)
+    stamp = time.strftime("%H:%M:%S", time.localtime(created)) + f".{int(created % 1 * 1000):03d}"
+    parts = [stamp, f"{LEVEL_NAMES[level]:7}", subsystem, event]
+    parts.extend(f"{key}={format_value(value)}" for key, value in fields.items())
+    return " ".join(parts)
+
+
+def _write_batch(batch):
+    global _dropped
+    lines = [format_record(record) for record in batch]
+    if _dropped:
+        lines.append(format_record((time.time(), WARNING, "log", "dropped", {"records": _dropped})))
+        _dropped = 0
+    stream.write("\n".join(lines) + "\n")
+    stream.flush()
+
+
+def _next_batch(block):
+    try:
+        batch = [_queue.get(block)]
+    except queue.Empty:
+        return []
+    while len(batch) < BATCH_SIZE:
+        try:
+            batch.append(_queue.get_nowait())
+        except queue.Empty:
+            break
+    return batch
+
+
+def _writer():
+    while True:
+        _write_batch(_next_batch(True))
+
+
+def _start_writer():
+    global _writer_pid
+    with _writer_lock:
+        if _writer_pid == os.getpid():
+            return
+        if _writer_pid is not None:
+            _queue.queue.clear()  # Forked: the parent's writer owns these records
+        _writer_pid = os.getpid()
+        threading.Thread(target=_writer, name="log-writer", daemon=True).start()
+
+
+def flush():
+    """Writes out everything still queued, from the calling thread."""
+    while True:
+        batch = _next_batch(False)
+        if not batch:
+            return
+        _write_batch(batch)
+
+
+atexit.register(flush)
@@ -1,32 +1,91 @@
+import argparse
+import asyncio
+import multiprocessing
+import signal
 import socket
+import sys
 import threading
 import ssl
 
-from handler import handle_client
+import handler
+from handler import handle_client, handle_client_async
+from workers import Router, reuse_port_supported
+from log import configure as configure_logging, get_logger
+from metrics import start_metrics_server
+from journal import Journal
+from archive import Archive
+import timers
+
+log = get_logger("server")
 
 HOST = '0.0.0.0'
 PORT = 60000
+HANDSHAKE_TIMEOUT = 10 # Seconds a client gets to finish the TLS handshake
+SESSION_TICKETS = 2 # TLS 1.3 tickets issued per handshake, so reconnects can resume
+METRICS_PORT = 60100 # Prometheus /metrics on localhost; worker i uses METRICS_PORT + i
+JOURNAL_DIR = "journal" # Move journals for crash recovery, see journal.py
+ARCHIVE_DIR = "archive" # Finished games, see archive.py
+HIBERNATE_AFTER = 600 # Seconds without a move before a room's board is hibernated
+IDLE_TIMEOUT = 45 # Seconds a connection can stay silent (PINGs unanswered) before it is dropped
+REAP_INTERVAL = 5 # How often quiet connections are checked
+UNCLAIMED_TTL = 24 * 3600 # Seconds an empty room recovered from the journal is kept for its players to return
 
-def start_server():
+def create_ssl_context():
     context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
     context.load_cert_chain(certfile="cert.pem", keyfile="key.pem")
+    # Resumed sessions skip the certificate exchange, which keeps reconnect storms cheap
+    context.options &= ~ssl.OP_NO_TICKET
+    context.num_tickets = SESSION_TICKETS
+    return context
+
+def handshake_and_handle(context, conn, addr):
+    """Runs in the connection's own thread so a slow handshake never blocks accept()."""
+    try:
+        conn.settimeout(HANDSHAKE_TIMEOUT)
+        secure_conn = context.wrap_socket(conn, server_side=True)
+        secure_conn.settimeout(None)
+    except (ssl.SSLError, OSError) as e:
+        log.warning("tls_handshake_failed", addr=addr, error=e)
+        conn.close()
+        return
+    handle_client(secure_conn, addr)
+
+def serve_internal(port):
+    """Accepts players forwarded by other workers (plain TCP, loopback only)."""
+    internal_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    internal_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    internal_socket.bind(("127.0.0.1", port))
+    internal_socket.listen()
+    while True:
+        conn, addr = internal_socket.accept()
+        threading.Thread(target=handle_client, args=(conn, addr), daemon=True).start()
+
+def start_server(router=None):
+    context = create_ssl_context()
+    handler.recover_rooms()
 
     server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    # A restart can bind while connections from the last run sit in TIME_WAIT (asyncio's start_server does the same)
+    server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if router:
+        # Every worker binds the same port; the kernel load-balances accepts between them
+        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        threading.Thread(target=serve_internal, args=(router.internal_port,), daemon=True).start()
     server_socket.bind((HOST, PORT))
     server_socket.listen()
     server_socket.settimeout(1)
+    start_reaper()
 
-    print(f"[LISTENING] Server running on {HOST}:{PORT}")
+    log.info("listening", host=HOST, port=PORT, mode="threaded")
 
     try:
         while True:
             try:
                 conn, addr = server_socket.accept()
-                secure_conn = context.wrap_socket(conn, server_side=True)
 
                 thread = threading.Thread(
-                    target=handle_client, 
-                    args=(secure_conn, addr), 
+                    target=handshake_and_handle, 
+                    args=(context, conn, addr), 
                     daemon=True
                 )
 
@@ -41,9 +100,140 @@ def start_server():
             except socket.timeout:
                 continue 
     except KeyboardInterrupt:
-        print("\n[SHUTTING DOWN] Server stopped by user")
+        log.info("shutdown", reason="interrupted")
         server_socket.close()
 
+async def serve_async(router=None):
+    handler.recover_rooms()
+    # One event loop holds every connection; idle players cost a coroutine, not a thread.
+    server = await asyncio.start_server(handle_client_async, HOST, PORT, ssl=create_ssl_context(),
+                                        ssl_handshake_timeout=HANDSHAKE_TIMEOUT,
+                                        reuse_port=router is not None)
+    if router:
+        await asyncio.start_server(handle_client_async, "127.0.0.1", router.internal_port)
+    start_reaper(asyncio.get_running_loop())
+    log.info("listening", host=HOST, port=PORT, mode="async")
+    async with server:
+        await server.serve_forever()
+
+def start_async_server(router=None):
+    try:
+        asyncio.run(serve_async(router))
+    except KeyboardInterrupt:
+        log.info("shutdown", reason="interrupted")
+
+def start_metrics(port):
+    if port:
+        start_metrics_server(port)
+        log.info("metrics", url=f"http://127.0.0.1:{port}/metrics")
+
+def open_journal(directory):
+    if directory:
+        handler.journal = Journal(directory)
+
+def open_archive(directory, tag=""):
+    if directory:
+        handler.archive = Archive(directory, tag)
+
+def start_hibernation(seconds):
+    if seconds:
+        handler.hibernate_after = seconds
+        timers.every(min(60, seconds / 2), handler.hibernate_idle_rooms)
+
+def start_expiry(seconds):
+    if seconds and handler.journal:
+        handler.unclaimed_ttl = seconds
+        timers.every(min(60, seconds / 2), handler.expire_unclaimed_rooms)
+
+def start_reaper(loop=None):
+    """
+    Drops connections that stopped answering PINGs. In asyncio mode the job is
+    passed to the event loop, since connections there are not thread-safe.
+    """
+    if not handler.idle_timeout:
+        return
+    if loop:
+        timers.every(REAP_INTERVAL, lambda: loop.call_soon_threadsafe(handler.reap_idle_connections))
+    else:
+        timers.every(REAP_INTERVAL, handler.reap_idle_connections)
+
+def start_services(args, index=None):
+    """Metrics, journal, archive and timer jobs for one server process (worker index, if any)."""
+    start_metrics(args.metrics_port + (index or 0) if args.metrics_port else 0)
+    open_journal(args.journal)
+    open_archive(args.archive, "" if index is None else index)
+    start_hibernation(args.hibernate_after)
+    start_expiry(args.unclaimed_ttl)
+    timers.every(1, handler.expire_seats)
+    handler.idle_timeout = args.idle_timeout # The reaper itself starts with the server, see start_reaper
+
+def run_worker(index, args):
+    router = Router(index, args.workers, PORT)
+    handler.router = router
+    log.info("worker", index=index, workers=args.workers, internal_port=router.internal_port)
+    start_services(args, index)
+    if args.mode == "async":
+        start_async_server(router)
+    else:
+        start_server(router)
+
+def start_workers(args):
+    """Runs args.workers server processes, each with its own GIL, sharing the public port."""
+    workers = [multiprocessing.Process(target=run_worker, args=(i, args)) for i in range(args.workers)]
+    for worker in workers:
+        worker.start()
+    # Stopping the parent stops the workers too
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        pass  # Each worker got the same Ctrl+C and shuts itself down
+    finally:
+        for worker in workers:
+            worker.terminate()
+            worker.join()
+
 if __name__ == "__main__":
-    start_server()
+    parser = argparse.ArgumentParser(description="TCP Chess server")
+    parser.add_argument("--mode", choices=["threaded", "async"], default="threaded",
+                        help="threaded: one thread per connection; async: one asyncio event loop")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="server processes to run; rooms are split between them (Linux only)")
+    parser.add_argument("--log-level", default="info",
+                        help="LEVEL and/or subsystem=LEVEL pairs, comma separated, "
+                             "e.g. warning,handler=info,engine=debug "
+                             "(subsystems: server, handler, engine, journal, archive)")
+    parser.add_argument("--log-format", choices=["text", "json"], default="text")
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT,
+                        help=f"port for Prometheus metrics on 127.0.0.1, 0 to disable (default: {METRICS_PORT})")
+    parser.add_argument("--journal", default=JOURNAL_DIR,
+                        help=f"directory for move journals, replayed on startup; empty to disable (default: {JOURNAL_DIR})")
+    parser.add_argument("--archive", default=ARCHIVE_DIR,
+                        help=f"directory for finished games, see server/archive.py; empty to disable (default: {ARCHIVE_DIR})")
+    parser.add_argument("--hibernate-after", type=float, default=HIBERNATE_AFTER,
+                        help=f"seconds a room can sit idle before its board is hibernated, 0 to never "
+                             f"(default: {HIBERNATE_AFTER})")
+    parser.add_argument("--idle-timeout", type=float, default=IDLE_TIMEOUT,
+                        help=f"seconds a connection can go without sending anything, PINGs included, "
+                             f"before it is dropped; 0 to never (default: {IDLE_TIMEOUT})")
+    parser.add_argument("--unclaimed-ttl", type=float, default=UNCLAIMED_TTL,
+                        help=f"seconds an empty room kept in the journal waits for its players before it "
+                             f"and its journal are deleted; 0 to keep forever (default: {UNCLAIMED_TTL})")
+    args = parser.parse_args()
+
+    try:
+        configure_logging(args.log_level, args.log_format)
+    except ValueError as e:
+        parser.error(str(e))
 
+    if args.workers > 1:
+        if not reuse_port_supported():
+            parser.error("--workers needs SO_REUSEPORT, which this platform does not have")
+        start_workers(args)
+    elif args.mode == "async":
+        start_services(args)
+        start_async_server()
+    else:
+        start_services(args)
+        start_server()
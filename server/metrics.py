@@ -0,0 +1,156 @@
+## Metrics
+##
+## Counters, gauges and latency histograms kept in memory and served in the
+## Prometheus text format on http://127.0.0.1:<port>/metrics (main.py --metrics-port).
+## Recording is a lock and an integer add, so it's cheap enough for every message.
+##
+## For alerting on p99 move latency:
+##   histogram_quantile(0.99, rate(chess_message_seconds_bucket{type="MOVE"}[5m]))
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+registry = []  # Every metric, in the order they are rendered
+
+
+def format_labels(label, key):
+    return f'{{{label}="{key}"}}' if label else ""
+
+
+class Counter:
+
+    def __init__(self, name, help, label=None):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.values = {}  # { label value: count }
+        self.lock = threading.Lock()
+        registry.append(self)
+
+    def inc(self, amount=1, key=None):
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for key, value in self.values.items():
+                lines.append(f"{self.name}{format_labels(self.label, key)} {value}")
+        return lines
+
+
+class Gauge:
+    """A value that goes up and down, or is read from func() at scrape time."""
+
+    def __init__(self, name, help, func=None):
+        self.name = name
+        self.help = help
+        self.func = func
+        self.value = 0
+        self.lock = threading.Lock()
+        registry.append(self)
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def render(self):
+        value = self.func() if self.func else self.value
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge",
+                f"{self.name} {value}"]
+
+
+class Histogram:
+
+    def __init__(self, name, help, label, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.buckets = buckets
+        self.series = {}  # { label value: [count per bucket..., +Inf count, sum] }
+        self.lock = threading.Lock()
+        registry.append(self)
+
+    def observe(self, key, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, key):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(key, time.perf_counter() - start)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            snapshot = {key: list(series) for key, series in self.series.items()}
+        for key, series in snapshot.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{self.label}="{key}",le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{self.label}="{key}"}} {series[-1]}')
+            lines.append(f'{self.name}_count{{{self.label}="{key}"}} {cumulative}')
+        return lines
+
+
+def render():
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# --- Server metrics ---
+
+MESSAGE_SECONDS = Histogram("chess_message_seconds",
+                            "Time to handle one client message, by message type", "type")
+ENGINE_SECONDS = Histogram("chess_engine_seconds",
+                           "Time spent in the rules engine, by operation", "op")
+BYTES_RECEIVED = Counter("chess_bytes_received_total", "Bytes read from clients")
+BYTES_SENT = Counter("chess_bytes_sent_total", "Bytes written to clients")
+CONNECTIONS = Gauge("chess_connections", "Open client connections")
+IDLE_REAPED = Counter("chess_idle_reaped_total", "Connections dropped for not answering PINGs")
+THREADS = Gauge("chess_threads", "Live threads in this process", threading.active_count)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Scrapes every few seconds would drown out the server log
+
+
+def start_metrics_server(port, host="127.0.0.1"):
+    """Serves /metrics from a background thread."""
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
@@ -0,0 +1,150 @@
+## Outboxes
+##
+## Every connection has an outbox: a bounded queue of already-encoded frames,
+## drained by that connection's own writer (a thread, or a task in asyncio mode).
+## Putting a frame never blocks, so the thread handling a move never waits on
+## another client's socket. If the queue is full, put() returns False and the
+## caller decides what to do with the slow reader (see handler.send_bytes).
+
+import asyncio
+import queue
+import socket
+import threading
+import time
+
+OUTBOX_SIZE = 256  # Frames queued before a reader counts as backed up
+CLOSE_TIMEOUT = 5  # Seconds a closing connection gets to take what is still queued
+
+_CLOSE = None  # Sentinel that stops a writer
+
+
+class ThreadOutbox:
+
+    def __init__(self, conn, addr=None, size=OUTBOX_SIZE):
+        self.conn = conn
+        self.addr = addr
+        self.queue = queue.Queue(size)
+        self.closed = False
+        self.resyncs = 0  # Overflows since the queue last drained
+        self.last_seen = time.monotonic()  # When the peer last sent anything, see handler.reap_idle_connections
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def put(self, frame):
+        if self.closed:
+            return False
+        try:
+            self.queue.put_nowait(frame)
+            return True
+        except queue.Full:
+            return False
+
+    def replace(self, frame):
+        """Throws away everything queued and queues frame instead."""
+        self.clear()
+        self.resyncs += 1
+        return self.put(frame)
+
+    def clear(self):
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                return
+
+    def run(self):
+        while True:
+            frame = self.queue.get()
+            if frame is _CLOSE:
+                break
+            try:
+                self.conn.sendall(frame)
+            except OSError:
+                self.closed = True
+                break
+            if self.queue.empty():
+                self.resyncs = 0  # Caught up
+        self.conn.close()
+
+    def close(self, drop=False):
+        """
+        Closes the connection once what is queued has been written, or at once
+        if drop is set.
+        """
+        if self.closed and not drop:
+            return
+        self.closed = True
+        if drop:
+            try:
+                self.conn.shutdown(socket.SHUT_RDWR)  # Also wakes the reader thread
+            except OSError:
+                pass
+        try:
+            self.conn.settimeout(CLOSE_TIMEOUT)  # A peer that stopped reading can't hold the writer forever
+        except OSError:
+            pass
+        try:
+            self.queue.put_nowait(_CLOSE)
+        except queue.Full:
+            # Nothing queued will be wanted any more
+            self.clear()
+            self.queue.put_nowait(_CLOSE)
+
+
+class AsyncOutbox:
+
+    def __init__(self, writer, addr=None, size=OUTBOX_SIZE):
+        self.writer = writer
+        self.addr = addr
+        self.queue = asyncio.Queue(size)
+        self.closed = False
+        self.resyncs = 0
+        self.last_seen = time.monotonic()
+        self.task = asyncio.get_running_loop().create_task(self.run())
+
+    def put(self, frame):
+        if self.closed:
+            return False
+        try:
+            self.queue.put_nowait(frame)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    def replace(self, frame):
+        self.clear()
+        self.resyncs += 1
+        return self.put(frame)
+
+    def clear(self):
+        while not self.queue.empty():
+            self.queue.get_nowait()
+
+    async def run(self):
+        while True:
+            frame = await self.queue.get()
+            if frame is _CLOSE:
+                break
+            try:
+                self.writer.write(frame)
+                await self.writer.drain()
+            except (OSError, ConnectionError):
+                self.closed = True
+                break
+            if self.queue.empty():
+                self.resyncs = 0
+        self.writer.close()
+        asyncio.get_running_loop().call_later(CLOSE_TIMEOUT, self.writer.transport.abort)
+
+    def close(self, drop=False):
+        if self.closed and not drop:
+            return
+        self.closed = True
+        if drop:
+            self.task.cancel()
+            self.writer.transport.abort()  # The connection's read loop sees EOF and cleans up
+            return
+        try:
+            self.queue.put_nowait(_CLOSE)
+        except asyncio.QueueFull:
+            self.clear()
+            self.queue.put_nowait(_CLOSE)
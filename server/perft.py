@@ -0,0 +1,205 @@
+## Perft (move path enumeration) and engine benchmarks
+##
+## Counts every leaf of the legal move tree to a fixed depth and compares it with
+## published node counts, so any rules regression shows up as a wrong number.
+## The engines have no castling or en passant, so each reference position is only
+## checked to the depth where those moves first appear in the published counts.
+##
+##   python server/perft.py                          # correctness suite, both engines
+##   python server/perft.py --engine list --position startpos --depth 4 --divide
+##   python server/perft.py --bench                  # validate_move / is_in_check / is_checkmate
+
+import argparse
+import sys
+import time
+
+from game import ChessGame
+from bitboard import BitboardGame
+
+ENGINES = {
+    "list": ChessGame,
+    "bitboard": BitboardGame,
+}
+
+# name: (FEN, [nodes at depth 1, 2, ...])
+REFERENCE_POSITIONS = {
+    "startpos": ("rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w", [20, 400, 8902, 197281]),
+    "position3": ("8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w", [14, 191]),
+    "position4": ("r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w", [6]),
+    "position4_mirrored": ("r2q1rk1/pP1p2pp/Q4n2/bbp1p3/Np6/1B3NBn/pPPP1PPP/R3K2R b", [6]),
+    "position6": ("r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w",
+                  [46, 2079, 89890, 3894594]),
+}
+
+# The suite stops here by default; deeper counts are still checked with --depth.
+DEFAULT_MAX_DEPTH = 3
+
+PROMOTIONS = ("q", "r", "b", "n")
+
+
+def board_from_fen(fen):
+    """Returns (8x8 board, role to move) from the first two FEN fields."""
+    fields = fen.split()
+    board = []
+    for rank in fields[0].split("/"):
+        row = []
+        for char in rank:
+            if char.isdigit():
+                row.extend(["."] * int(char))
+            else:
+                row.append(char)
+        board.append(row)
+    role = "black" if len(fields) > 1 and fields[1] == "b" else "white"
+    return board, role
+
+
+def load_position(engine, fen):
+    game = ENGINES[engine]()
+    board, role = board_from_fen(fen)
+    game.set_board(board)
+    return game, role
+
+
+def perft(game, role, depth):
+    if depth == 0:
+        return 1
+
+    moves = game.generate_legal_moves(role)
+    if depth == 1:
+        # Bulk count: each promoting pawn move is four leaves
+        board = None  # Only built when a move reaches the last rank
+        nodes = len(moves)
+        for src, dst in moves:
+            if dst[1] in "18":
+                board = board or game.get_board()
+                if board[8 - int(src[1])][ord(src[0]) - ord('a')] in "Pp":
+                    nodes += len(PROMOTIONS) - 1
+        return nodes
+
+    opponent = "black" if role == "white" else "white"
+    nodes = 0
+    for src, dst in moves:
+        _, promoted = game.push((src, dst))
+        nodes += perft(game, opponent, depth - 1)
+        game.pop()
+        if promoted:
+            for piece in PROMOTIONS[1:]:
+                game.push((src, dst, piece))
+                nodes += perft(game, opponent, depth - 1)
+                game.pop()
+    return nodes
+
+
+def divide(game, role, depth):
+    """Node count below each root move, for tracking down a wrong total."""
+    opponent = "black" if role == "white" else "white"
+    counts = {}
+    for src, dst in game.generate_legal_moves(role):
+        _, promoted = game.push((src, dst))
+        pieces = PROMOTIONS if promoted else (None,)
+        game.pop()
+        for piece in pieces:
+            game.push((src, dst, piece))
+            counts[src + dst + (piece or "")] = perft(game, opponent, depth - 1)
+            game.pop()
+    return counts
+
+
+def run_suite(engines, positions, max_depth, show_divide=False):
+    failures = 0
+    for engine in engines:
+        total_nodes = 0
+        total_time = 0.0
+        for name in positions:
+            fen, expected = REFERENCE_POSITIONS[name]
+            for depth, want in enumerate(expected[:max_depth], start=1):
+                game, role = load_position(engine, fen)
+                start = time.perf_counter()
+                got = perft(game, role, depth)
+                elapsed = time.perf_counter() - start
+                total_nodes += got
+                total_time += elapsed
+
+                status = "ok" if got == want else "FAIL"
+                if got != want:
+                    failures += 1
+                print(f"{engine:9} {name:19} depth {depth}  {got:>9} nodes  "
+                      f"(expected {want:>9})  {got / max(elapsed, 1e-9):>11,.0f} nodes/s  {status}")
+
+                if show_divide and got != want:
+                    for move, nodes in sorted(divide(game, role, depth).items()):
+                        print(f"    {move}: {nodes}")
+        print(f"{engine:9} total {total_nodes} nodes in {total_time:.2f}s "
+              f"({total_nodes / max(total_time, 1e-9):,.0f} nodes/s)\n")
+    return failures
+
+
+def bench_call(label, func, calls, per_call=1):
+    """Times calls runs of func; per_call is how many engine calls one run makes."""
+    start = time.perf_counter()
+    for _ in range(calls):
+        func()
+    elapsed = time.perf_counter() - start
+    total = calls * per_call
+    print(f"    {label:20} {total:>8} calls  {total / max(elapsed, 1e-9):>12,.0f} calls/s  "
+          f"{elapsed / total * 1e6:>9.2f} us/call")
+
+
+def run_bench(engines, positions, calls):
+    for engine in engines:
+        for name in positions:
+            fen, _ = REFERENCE_POSITIONS[name]
+            game, role = load_position(engine, fen)
+            print(f"{engine} / {name}")
+
+            # validate_move from every movable piece to every square, legal or not
+            sources = sorted({src for src, _ in game.generate_legal_moves(role)})
+            pairs = [(src, chr(ord('a') + c) + str(r)) for src in sources
+                     for r in range(1, 9) for c in range(8)]
+
+            def validate_all():
+                for src, dst in pairs:
+                    game.validate_move(src, dst, role)
+
+            if pairs:
+                bench_call("validate_move", validate_all, max(1, calls // len(pairs)), len(pairs))
+            bench_call("is_in_check", lambda: game.is_in_check(role), calls)
+            # is_checkmate returns early unless in check; generate_legal_moves is its worst case
+            bench_call("is_checkmate", lambda: game.is_checkmate(role), calls)
+            bench_call("generate_legal_moves", lambda: game.generate_legal_moves(role), max(1, calls // 10))
+        print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Perft correctness suite and engine benchmarks")
+    parser.add_argument("--engine", choices=sorted(ENGINES), action="append",
+                        help="engine to run (default: all)")
+    parser.add_argument("--position", choices=sorted(REFERENCE_POSITIONS), action="append",
+                        help="reference position (default: all)")
+    parser.add_argument("--depth", type=int, default=DEFAULT_MAX_DEPTH,
+                        help=f"maximum depth to check (default: {DEFAULT_MAX_DEPTH})")
+    parser.add_argument("--divide", action="store_true",
+                        help="print per-move node counts for failing depths")
+    parser.add_argument("--bench", action="store_true",
+                        help="microbenchmark validate_move, is_in_check and is_checkmate instead")
+    parser.add_argument("--calls", type=int, default=20000,
+                        help="calls per benchmarked function and position in --bench mode")
+    args = parser.parse_args()
+
+    engines = args.engine or list(ENGINES)
+    positions = args.position or list(REFERENCE_POSITIONS)
+
+    if args.bench:
+        run_bench(engines, positions, args.calls)
+        return 0
+
+    failures = run_suite(engines, positions, args.depth, args.divide)
+    if failures:
+        print(f"{failures} perft mismatch(es)")
+        return 1
+    print("All perft counts match")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
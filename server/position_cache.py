@@ -0,0 +1,89 @@
+## Process-wide cache of position verdicts
+##
+## Rooms that reach the same position (common openings especially) share one
+## legal-move generation. Entries are keyed by Zobrist hash plus side to move
+## and evicted least-recently-used once the cache is full.
+
+import threading
+from collections import OrderedDict, namedtuple
+
+from zobrist import SIDE_KEYS
+
+POSITION_CACHE_SIZE = 50000
+
+
+class PositionStatus(namedtuple("PositionStatus", "moves in_check checkmate stalemate")):
+    """
+    Verdict for the side to move. moves packs every legal move as 4 characters
+    ("e2e4e7e5..."), which keeps entries small.
+    """
+
+    __slots__ = ()
+
+    def legal_moves(self):
+        moves = self.moves
+        return [(moves[i:i + 2], moves[i + 2:i + 4]) for i in range(0, len(moves), 4)]
+
+    @property
+    def game_over(self):
+        return self.checkmate or self.stalemate
+
+
+class PositionCache:
+
+    def __init__(self, max_size=POSITION_CACHE_SIZE):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self.lock:
+            status = self.entries.get(key)
+            if status is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return status
+
+    def put(self, key, status):
+        with self.lock:
+            self.entries[key] = status
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            return {
+                "size": len(self.entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+POSITION_CACHE = PositionCache()
+
+
+def analyse_position(game, role, cache=POSITION_CACHE):
+    """Legal moves and check / checkmate / stalemate verdict for role to move, cached by position."""
+    key = game.zobrist ^ SIDE_KEYS[role]
+    status = cache.get(key)
+    if status is not None:
+        return status
+
+    moves = "".join(src + dst for src, dst in game.generate_legal_moves(role))
+    in_check = game.is_in_check(role)
+    status = PositionStatus(moves, in_check, in_check and not moves, not in_check and not moves)
+    cache.put(key, status)
+    return status
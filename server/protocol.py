@@ -0,0 +1,207 @@
+## Message framing
+##
+## Every message on the wire is a 4-byte big-endian length followed by that many
+## bytes of payload, so messages TCP splits or coalesces are reassembled exactly.
+## client/protocol.py is the client-side copy of this module.
+
+import json
+import struct
+
+HEADER = struct.Struct("!I")
+MAX_FRAME_SIZE = 1 << 20  # Anything larger is a broken or hostile peer
+
+
+class FrameError(Exception):
+    pass
+
+
+def encode_frame(payload):
+    return HEADER.pack(len(payload)) + payload
+
+
+def encode_json(data):
+    return encode_frame(json.dumps(data).encode("utf-8"))
+
+
+class FrameDecoder:
+    """Buffers received bytes and returns every complete payload in them."""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        buffer = self.buffer
+        buffer += data
+        frames = []
+        offset = 0
+        while len(buffer) - offset >= HEADER.size:
+            (length,) = HEADER.unpack_from(buffer, offset)
+            if length > MAX_FRAME_SIZE:
+                raise FrameError(f"Frame of {length} bytes exceeds {MAX_FRAME_SIZE}")
+            end = offset + HEADER.size + length
+            if end > len(buffer):
+                break
+            frames.append(bytes(buffer[offset + HEADER.size:end]))
+            offset = end
+        if offset:
+            del buffer[:offset]
+        return frames
+
+
+# --- Binary mode ---
+#
+# Negotiated per connection with "protocol": "binary" in JOIN. Moves and their
+# results then travel as a few fixed bytes instead of JSON dicts; everything else
+# (JOIN replies, errors, name tables) stays JSON. A JSON payload always starts
+# with "{", which no binary message kind does, so both can share a connection.
+#
+#   MOVE   (client -> server): kind, move code
+#   RESULT (server -> mover) / UPDATE (server -> other players):
+#          kind, move code, status bits, captured piece, promoted piece,
+#          then, if STATUS_LEGAL is set, one move code per legal move of the
+#          side now to move
+#
+# A move code packs src (6 bits) | dst (6 bits) << 6 | promotion (3 bits) << 12.
+# Player names are not repeated: they are sent once in the JOIN reply and in
+# NAMES messages, and the status bits say which side moved.
+
+PROTOCOLS = ("json", "binary")
+
+MSG_MOVE = 0x01
+MSG_RESULT = 0x02
+MSG_UPDATE = 0x03
+
+MOVE_MESSAGE = struct.Struct("!BH")
+RESULT_MESSAGE = struct.Struct("!BHBcc")
+
+STATUS_SUCCESS = 0x01
+STATUS_GAME_OVER = 0x02
+STATUS_BLACK_MOVED = 0x04
+STATUS_CHECKMATE = 0x08
+STATUS_LEGAL = 0x10
+
+PROMOTION_PIECES = ".qrbn"  # Index 0 means no promotion
+NO_PIECE = b"\0"
+
+
+def is_json(payload):
+    return payload[:1] == b"{"
+
+
+def square_index(square):
+    if not isinstance(square, str) or len(square) != 2 or square[1] not in "12345678":
+        raise ValueError(f"Invalid square {square!r}")
+    col = ord(square[0]) - ord('a')
+    if not 0 <= col < 8:
+        raise ValueError(f"Invalid square {square!r}")
+    return (8 - int(square[1])) * 8 + col
+
+
+def square_name(index):
+    return chr(ord('a') + (index & 7)) + str(8 - (index >> 3))
+
+
+def encode_move(src, dst, promotion=None):
+    promo = PROMOTION_PIECES.find(promotion.lower()) if promotion else 0
+    return square_index(src) | square_index(dst) << 6 | max(promo, 0) << 12
+
+
+def decode_move(code):
+    promo = code >> 12 & 7
+    promotion = PROMOTION_PIECES[promo] if 0 < promo < len(PROMOTION_PIECES) else None
+    return square_name(code & 63), square_name(code >> 6 & 63), promotion
+
+
+SQUARE_NAMES = [square_name(index) for index in range(64)]
+SQUARE_INDEXES = {name: index for index, name in enumerate(SQUARE_NAMES)}
+
+
+def legal_move_codes(legal):
+    """Move codes for a packed legal move list ("e2e4e7e5...", see parse_legal_moves)."""
+    return [SQUARE_INDEXES[legal[i:i + 2]] | SQUARE_INDEXES[legal[i + 2:i + 4]] << 6
+            for i in range(0, len(legal), 4)]
+
+
+def parse_legal_moves(legal):
+    """
+    { src: [dst, ...] } from the packed legal move list the server sends with
+    the position ("legal": 4 characters per move, e.g. "e2e4e7e5...").
+    """
+    targets = {}
+    for i in range(0, len(legal or ""), 4):
+        targets.setdefault(legal[i:i + 2], []).append(legal[i + 2:i + 4])
+    return targets
+
+
+def encode_move_message(src, dst, promotion=None):
+    return encode_frame(MOVE_MESSAGE.pack(MSG_MOVE, encode_move(src, dst, promotion)))
+
+
+def decode_move_message(payload):
+    kind, code = MOVE_MESSAGE.unpack(payload)
+    if kind != MSG_MOVE:
+        raise FrameError(f"Unexpected binary message kind {kind}")
+    src, dst, promotion = decode_move(code)
+    return {"type": "MOVE", "selected_pos": src, "target_pos": dst, "promotion_to": promotion}
+
+
+def encode_result(data, mover_role):
+    """Binary form of a MOVE reply or UPDATE dict. Raises ValueError if it has no binary form."""
+    status = 0
+    if data["status"] == "success":
+        status |= STATUS_SUCCESS
+    if data.get("game_over"):
+        status |= STATUS_GAME_OVER
+    if data.get("reason") == "checkmate":
+        status |= STATUS_CHECKMATE
+    if mover_role == "black":
+        status |= STATUS_BLACK_MOVED
+    legal = data.get("legal")
+    codes = []
+    if legal is not None:
+        status |= STATUS_LEGAL
+        codes = legal_move_codes(legal)
+
+    kind = MSG_UPDATE if data.get("type") == "UPDATE" else MSG_RESULT
+    captured = (data.get("captured") or "\0").encode("ascii")
+    promoted = (data.get("promoted_to") or "\0").encode("ascii")
+    return encode_frame(RESULT_MESSAGE.pack(
+        kind, encode_move(data["from"], data["to"]), status, captured, promoted)
+        + struct.pack(f"!{len(codes)}H", *codes))
+
+
+def decode_result(payload, names):
+    """Rebuilds the same dict the JSON protocol sends, using the names table from JOIN / NAMES."""
+    kind, code, status, captured, promoted = RESULT_MESSAGE.unpack_from(payload)
+    src, dst, _ = decode_move(code)
+
+    success = bool(status & STATUS_SUCCESS)
+    game_over = bool(status & STATUS_GAME_OVER)
+    mover = "black" if status & STATUS_BLACK_MOVED else "white"
+    opponent = "white" if mover == "black" else "black"
+    winner = mover if status & STATUS_CHECKMATE else None
+    reason = None
+    if game_over:
+        reason = "checkmate" if winner else "stalemate"
+
+    message = {
+        "status": "success" if success else "fail",
+        "from": src,
+        "to": dst,
+        "captured": None if captured == NO_PIECE else captured.decode("ascii"),
+        "game_over": game_over,
+        "winner": winner,
+        "reason": reason,
+        "promoted_to": None if promoted == NO_PIECE else promoted.decode("ascii"),
+        "mover_name": names.get(mover, "Player"),
+        "opponent_name": names.get(opponent, "Opponent"),
+        "winner_name": names.get(winner, "Player") if winner else None,
+    }
+    if status & STATUS_LEGAL:
+        codes = struct.unpack_from(f"!{(len(payload) - RESULT_MESSAGE.size) // 2}H", payload, RESULT_MESSAGE.size)
+        message["legal"] = "".join([SQUARE_NAMES[code & 63] + SQUARE_NAMES[code >> 6 & 63] for code in codes])
+    if kind == MSG_UPDATE:
+        message["type"] = "UPDATE"
+    else:
+        message["message"] = "Move Made." if success else "Invalid Move"
+    return message
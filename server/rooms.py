@@ -0,0 +1,172 @@
+## Room registry
+##
+## Rooms live in a fixed number of shards, each a dict with its own lock, so
+## lookups in different rooms never wait on one global lock. Each room has its
+## own lock too; everything that reads or changes a room's seats, board or turn
+## holds it.
+##
+## Lock order is always room lock -> shard lock, never the other way round.
+##
+## A room nobody has touched for a while can be hibernated: its board and move
+## list are swapped for an array of 16-bit move codes, and rebuilt by replaying
+## them the next time anything reads room.board or room.moves.
+
+import threading
+import time
+from array import array
+from contextlib import contextmanager
+
+from protocol import decode_move, encode_move
+
+ROOM_SHARDS = 64
+
+
+class Room:
+
+    def __init__(self, name, engine, board):
+        self.name = name
+        self.players = []  # [conn1, conn2]
+        self.roles = {}  # { conn: "white" | "black" }
+        self.names = {}  # { conn: "name" }
+        self.spectators = []  # [conn, ...] watching, not playing
+        self.tokens = {}  # { role: resume token } issued at JOIN
+        self.away = {}  # { role: (name, deadline) } seats held for dropped players until RESUME
+        self.seats = {}  # { role: name } who last sat in each seat, connected or not
+        self._board = board  # ChessGame or BitboardGame, None while hibernated
+        self.board_class = type(board)
+        self.engine = engine
+        self.turn = "white"
+        self._moves = []  # [(src, dst, promoted_to), ...] accepted so far
+        self.hibernated = None  # array("H") of move codes while hibernated
+        self.last_active = time.monotonic()
+        self.result = None  # { "game_over", "winner", "reason", "winner_name" } once decided
+        self.lock = threading.RLock()
+        self.closed = False  # Set once the room has been removed from the registry
+
+    @property
+    def board(self):
+        if self._board is None:
+            self.wake()
+        self.last_active = time.monotonic()
+        return self._board
+
+    @property
+    def moves(self):
+        if self._moves is None:
+            self.wake()
+        self.last_active = time.monotonic()
+        return self._moves
+
+    def hibernate(self):
+        """Frees the board and move list, keeping only the moves. Caller holds self.lock."""
+        if self._board is None:
+            return
+        self.hibernated = array("H", (encode_move(*move) for move in self._moves))
+        self._board = None
+        self._moves = None
+
+    def wake(self):
+        board = self.board_class()
+        moves = []
+        for code in self.hibernated:
+            src, dst, promotion = decode_move(code)
+            # The board gives back the piece it placed, cased by side like room.moves had it
+            _, promoted = board.push((src, dst, promotion), record=False)
+            moves.append((src, dst, promoted))
+        self._board = board
+        self._moves = moves
+        self.hibernated = None
+
+    def role_names(self):
+        """{ role: name } for the players currently in the room."""
+        return {self.roles[peer]: self.names.get(peer, "Player") for peer in self.players}
+
+
+class _Shard:
+
+    def __init__(self):
+        self.items = {}
+        self.lock = threading.Lock()
+
+
+class RoomRegistry:
+
+    def __init__(self, shards=ROOM_SHARDS):
+        self.room_shards = [_Shard() for _ in range(shards)]
+        self.client_shards = [_Shard() for _ in range(shards)]  # conn -> Room
+
+    def _room_shard(self, name):
+        return self.room_shards[hash(name) % len(self.room_shards)]
+
+    def _client_shard(self, conn):
+        return self.client_shards[hash(conn) % len(self.client_shards)]
+
+    def get(self, name):
+        shard = self._room_shard(name)
+        with shard.lock:
+            return shard.items.get(name)
+
+    def get_or_create(self, name, factory):
+        shard = self._room_shard(name)
+        with shard.lock:
+            room = shard.items.get(name)
+            if room is None:
+                room = factory()
+                if room is not None:
+                    shard.items[name] = room
+            return room
+
+    @contextmanager
+    def locked(self, name, factory=None):
+        """
+        Yields the named room with its lock held, creating it with factory() if
+        given, or yields None if it doesn't exist. A room removed while we waited
+        for its lock is skipped, so callers never touch a closed room.
+        """
+        while True:
+            room = self.get_or_create(name, factory) if factory else self.get(name)
+            if room is None:
+                yield None
+                return
+            with room.lock:
+                if room.closed:
+                    continue
+                yield room
+                return
+
+    def remove_if_empty(self, room):
+        """Drops the room once nobody is playing, watching or coming back. Caller holds room.lock."""
+        if room.players or room.spectators or room.away or room.closed:
+            return False
+        shard = self._room_shard(room.name)
+        with shard.lock:
+            if shard.items.get(room.name) is room:
+                del shard.items[room.name]
+        room.closed = True
+        return True
+
+    def bind(self, conn, room):
+        shard = self._client_shard(conn)
+        with shard.lock:
+            shard.items[conn] = room
+
+    def unbind(self, conn):
+        shard = self._client_shard(conn)
+        with shard.lock:
+            return shard.items.pop(conn, None)
+
+    def room_of(self, conn):
+        shard = self._client_shard(conn)
+        with shard.lock:
+            return shard.items.get(conn)
+
+    def __len__(self):
+        return sum(len(shard.items) for shard in self.room_shards)
+
+    def rooms(self):
+        """Snapshot of every live room."""
+        result = []
+        for shard in self.room_shards:
+            with shard.lock:
+                result.extend(shard.items.values())
+        return result
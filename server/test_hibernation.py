@@ -0,0 +1,89 @@
+## Hibernation round trip: a room that hibernates and wakes must give back the
+## same moves, so a RESUME after it sends what the players saw live.
+##
+##   python -m pytest server/test_hibernation.py
+
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest  # noqa: E402
+
+import handler  # noqa: E402
+from protocol import FrameDecoder  # noqa: E402
+
+# White wins the a8 rook with the b-pawn and promotes to a queen on the last move
+MOVES = [("a2", "a4"), ("b7", "b5"), ("a4", "b5"), ("a7", "a6"), ("b5", "a6"),
+         ("c8", "b7"), ("a6", "b7"), ("b8", "c6"), ("b7", "a8", "q")]
+
+
+class FakeConn:
+    """Records every message handle_message sends to it."""
+
+    def __init__(self):
+        self.decoder = FrameDecoder()
+        self.messages = []
+
+    def sendall(self, data):
+        self.messages.extend(json.loads(payload) for payload in self.decoder.feed(data))
+
+    def close(self):
+        pass
+
+
+def join(conn, name, room, engine):
+    handler.handle_message(conn, (name, 0), {"type": "JOIN", "name": name, "room": room, "engine": engine})
+    return conn.messages[-1]
+
+
+@pytest.mark.parametrize("engine", sorted(handler.ENGINES))
+def test_resume_after_wake_keeps_promoted_piece(engine):
+    room_name = f"hibernate-promotion-{engine}"
+    white, black = FakeConn(), FakeConn()
+    token = join(white, "alice", room_name, engine)["token"]
+    join(black, "bob", room_name, engine)
+    for i, move in enumerate(MOVES):
+        conn = white if i % 2 == 0 else black
+        handler.handle_message(conn, ("player", 0), {
+            "type": "MOVE", "selected_pos": move[0], "target_pos": move[1],
+            "promotion_to": move[2] if len(move) > 2 else None})
+        assert conn.messages[-1]["status"] == "success", conn.messages[-1]
+
+    room = handler.registry.get(room_name)
+    live_moves = list(room.moves)
+    assert live_moves[-1] == ("b7", "a8", "Q")
+
+    # White drops, the room hibernates, then White resumes from before the promotion
+    handler.cleanup_client(white, ("alice", 0))
+    with room.lock:
+        room.hibernate()
+    assert room.hibernated is not None
+
+    resumed = FakeConn()
+    handler.handle_message(resumed, ("alice", 1), {
+        "type": "RESUME", "room": room_name, "token": token, "ply": len(MOVES) - 1})
+    reply = resumed.messages[-1]
+    assert reply["status"] == "resumed"
+    assert reply["moves"] == [["b7", "a8", "Q"]]
+    assert room.moves == live_moves
+
+    handler.cleanup_client(resumed, ("alice", 1))
+    handler.cleanup_client(black, ("bob", 0))
+
+
+def test_sweep_skips_a_room_that_cannot_hibernate(monkeypatch):
+    monkeypatch.setattr(handler, "hibernate_after", 0)
+    conns = {name: FakeConn() for name in ("broken", "healthy")}
+    for name, conn in conns.items():
+        join(conn, name, f"sweep-{name}", "list")
+    broken, healthy = handler.registry.get("sweep-broken"), handler.registry.get("sweep-healthy")
+    broken.moves.append(("e2x", "e4", None))  # Can't be packed into a move code
+
+    handler.hibernate_idle_rooms()
+    assert broken.hibernated is None and broken.moves[-1] == ("e2x", "e4", None)
+    assert healthy.hibernated is not None
+
+    for name, conn in conns.items():
+        handler.cleanup_client(conn, (name, 0))
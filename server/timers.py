@@ -0,0 +1,49 @@
+## Timers
+##
+## One background thread runs every periodic job in the process (hibernating
+## idle rooms, ...) so each feature doesn't start its own sleeping thread.
+## Jobs run one at a time on that thread: they must be quick and take the same
+## locks as any connection thread. The thread starts with the first job, so
+## each --workers process gets its own.
+
+import heapq
+import itertools
+import threading
+import time
+
+from log import get_logger
+
+log = get_logger("server")
+
+_jobs = []  # Heap of (due, sequence, interval, callback)
+_sequence = itertools.count()  # Breaks ties between jobs due at the same time
+_condition = threading.Condition()
+_thread = None
+
+
+def every(interval, callback):
+    """Calls callback() every interval seconds, first after one interval."""
+    global _thread
+    with _condition:
+        heapq.heappush(_jobs, (time.monotonic() + interval, next(_sequence), interval, callback))
+        if _thread is None:
+            _thread = threading.Thread(target=_run, name="timers", daemon=True)
+            _thread.start()
+        _condition.notify()
+
+
+def _run():
+    while True:
+        with _condition:
+            while True:
+                wait = _jobs[0][0] - time.monotonic()
+                if wait <= 0:
+                    break
+                _condition.wait(wait)
+            due, sequence, interval, callback = heapq.heappop(_jobs)
+            # Scheduled from when it was due, not when it finished, so jobs don't drift
+            heapq.heappush(_jobs, (max(due + interval, time.monotonic()), sequence, interval, callback))
+        try:
+            callback()
+        except Exception as e:
+            log.error("timer_failed", job=getattr(callback, "__name__", repr(callback)), error=e)
@@ -0,0 +1,109 @@
+## Multi-worker mode
+##
+## main.py --workers N starts N server processes that all listen on the public
+## port with SO_REUSEPORT, so the kernel spreads new connections across them.
+## Each room belongs to exactly one worker, picked by hashing its name. A worker
+## that accepts a JOIN for someone else's room opens a plain loopback connection
+## to the owner's internal port, replays the bytes it has already read and then
+## just copies bytes both ways. The owner sees an ordinary client.
+##
+## SO_REUSEPORT load balancing is Linux-only.
+
+import asyncio
+import socket
+import threading
+import zlib
+
+RECV_SIZE = 4096
+
+
+class ForwardConnection(Exception):
+    """Raised while reading a connection whose room is owned by another worker."""
+
+    def __init__(self, port, data):
+        super().__init__(port)
+        self.port = port
+        self.data = data  # Bytes already read from the client, to replay to the owner
+
+
+class Router:
+
+    def __init__(self, index, count, base_port):
+        self.index = index
+        self.count = count
+        # Worker i also listens on 127.0.0.1:base_port + 1 + i for forwarded players
+        self.ports = [base_port + 1 + i for i in range(count)]
+
+    def owner(self, room):
+        return zlib.crc32(str(room).encode("utf-8")) % self.count
+
+    def forward_port(self, room):
+        """Internal port of the worker that owns room, or None if it's this one."""
+        owner = self.owner(room)
+        return None if owner == self.index else self.ports[owner]
+
+    @property
+    def internal_port(self):
+        return self.ports[self.index]
+
+
+def reuse_port_supported():
+    return hasattr(socket, "SO_REUSEPORT")
+
+
+def pipe(source, destination):
+    """Copies bytes until source closes, then wakes whoever is reading destination."""
+    try:
+        while True:
+            data = source.recv(RECV_SIZE)
+            if not data:
+                break
+            destination.sendall(data)
+    except OSError:
+        pass
+    finally:
+        try:
+            destination.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+def forward_connection(conn, port, data):
+    """Relays a client connection to the worker listening on port. Blocks until either side closes."""
+    upstream = socket.create_connection(("127.0.0.1", port))
+    try:
+        upstream.sendall(data)
+        replies = threading.Thread(target=pipe, args=(upstream, conn), daemon=True)
+        replies.start()
+        pipe(conn, upstream)
+        replies.join()
+    finally:
+        upstream.close()
+
+
+async def pipe_async(reader, writer):
+    try:
+        while True:
+            data = await reader.read(RECV_SIZE)
+            if not data:
+                break
+            writer.write(data)
+            await writer.drain()
+    except OSError:
+        pass
+
+
+async def forward_connection_async(reader, writer, port, data):
+    """asyncio version of forward_connection."""
+    upstream_reader, upstream_writer = await asyncio.open_connection("127.0.0.1", port)
+    try:
+        upstream_writer.write(data)
+        await upstream_writer.drain()
+        tasks = [asyncio.ensure_future(pipe_async(reader, upstream_writer)),
+                 asyncio.ensure_future(pipe_async(upstream_reader, writer))]
+        # Whichever side closes first ends the relay
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in pending:
+            task.cancel()
+    finally:
+        upstream_writer.close()
@@ -0,0 +1,28 @@
+## Zobrist keys shared by every rules engine
+##
+## A position hash is the XOR of one key per (piece, square), so a move only has
+## to XOR out the squares it empties and XOR in the squares it fills.
+## Square index is row * 8 + col (0 = a8), the same as the engines use.
+
+import random
+
+# Fixed seed: hashes must be identical across processes and restarts.
+_rng = random.Random(0x7C9E55)
+
+PIECE_KEYS = {
+    piece: [_rng.getrandbits(64) for _ in range(64)]
+    for piece in "PNBRQKpnbrqk"
+}
+PIECE_KEYS["."] = [0] * 64
+
+# Folded into the key when looking a position up for black to move
+SIDE_KEYS = {"white": 0, "black": _rng.getrandbits(64)}
+
+
+def hash_board(board):
+    """Full hash of an 8x8 board; engines keep theirs up to date incrementally."""
+    h = 0
+    for row in range(8):
+        for col in range(8):
+            h ^= PIECE_KEYS[board[row][col]][row * 8 + col]
+    return h